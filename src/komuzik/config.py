@@ -1,108 +1,116 @@
-"""Configuration constants and settings for the bot."""
+"""Configuration constants and settings for the bot.
+
+Settings backed by ``config.yaml`` and ``.env`` are resolved lazily on first
+attribute access (PEP 562), so importing this module does not touch the
+filesystem.
+"""
+import functools
 import os
 import re
+import shutil
+from typing import Any, Callable, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from .config_loader import ConfigLoader
 
-# Load environment variables
-load_dotenv()
+@functools.lru_cache(maxsize=1)
+def _load_dotenv_once():
+    """Load .env into the environment; variables already set take precedence."""
+    load_dotenv(override=False)
 
-# Load YAML configuration
-_config = ConfigLoader()
 
-# API credentials
-API_ID = int(os.getenv("API_ID", 0))
-API_HASH = os.getenv("API_HASH")
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-SESSION_STRING = os.getenv("SESSION_STRING", "")
+def _env(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Read an environment variable, loading .env on first use."""
+    _load_dotenv_once()
+    return os.getenv(name, default)
 
-# URL regex patterns
-YOUTUBE_REGEX = re.compile(
-    r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/(watch\?v=|embed/|v/|shorts/|.+\?v=)?([^&=%\?]{11})'
-)
-TIKTOK_REGEX = re.compile(
-    r'(https?://)?(www\.|vm\.|vt\.)?(tiktok\.com)/(\S+)'
-)
-TWITTER_REGEX = re.compile(
-    r'(https?://)?(www\.|mobile\.)?(twitter\.com|x\.com)/(\S+)'
-)
 
-# ============= Video Settings =============
-VIDEO_SETTINGS = _config.get_section('video')
+@functools.lru_cache(maxsize=1)
+def _get_config() -> ConfigLoader:
+    """Load YAML configuration on first use."""
+    return ConfigLoader()
 
-DEFAULT_VIDEO_WIDTH = VIDEO_SETTINGS.get('default_youtube_width', 1280)
-DEFAULT_VIDEO_HEIGHT = VIDEO_SETTINGS.get('default_youtube_height', 720)
-DEFAULT_TIKTOK_WIDTH = VIDEO_SETTINGS.get('default_tiktok_width', 720)
-DEFAULT_TIKTOK_HEIGHT = VIDEO_SETTINGS.get('default_tiktok_height', 1280)
 
-# ============= Download Settings =============
-DOWNLOAD_SETTINGS = _config.get_section('downloads')
-
-MAX_DOWNLOADS_PER_USER = DOWNLOAD_SETTINGS.get('max_concurrent_per_user', 3)
-ADMIN_USER_IDS = set(DOWNLOAD_SETTINGS.get('admin_user_ids', []))
-UNLIMITED_USER_IDS = set(DOWNLOAD_SETTINGS.get('unlimited_user_ids', []))
-
-# ============= Audio Settings =============
-AUDIO_SETTINGS = _config.get_section('audio')
-
-AUDIO_FORMAT = AUDIO_SETTINGS.get('format', 'mp3')
-AUDIO_BITRATE = AUDIO_SETTINGS.get('default_bitrate', '192')
-AUDIO_QUALITY_SETTINGS = AUDIO_SETTINGS.get('quality_presets', {
-    'high': 'bestaudio/best',
-    'medium': 'bestaudio[abr<=128]/bestaudio/best',
-    'low': 'bestaudio[abr<=96]/bestaudio/best',
-})
-
-# ============= YT-DLP Settings =============
-YDLP_SETTINGS = _config.get_section('yt_dlp')
-
-YDLP_BASE_OPTS = {
-    'quiet': YDLP_SETTINGS.get('quiet', True),
-    'no_warnings': YDLP_SETTINGS.get('no_warnings', True),
-    'noplaylist': YDLP_SETTINGS.get('noplaylist', True),
-}
+def _section(name: str) -> Dict[str, Any]:
+    """Get a configuration section from the lazily loaded config."""
+    return _get_config().get_section(name)
 
-# ============= YouTube Settings =============
-YOUTUBE_SETTINGS = _config.get_section('youtube')
 
-VIDEO_FALLBACK_QUALITIES = YOUTUBE_SETTINGS.get('video_fallback_qualities', [1080, 720, 480, 360, 240])
-DEFAULT_SEARCH_RESULTS = YOUTUBE_SETTINGS.get('default_search_results', 5)
+def _ydlp_base_opts() -> Dict[str, Any]:
+    """Build yt-dlp options shared by every YoutubeDL instance."""
+    settings = _section('yt_dlp')
+    opts = {
+        'quiet': settings.get('quiet', True),
+        'no_warnings': settings.get('no_warnings', True),
+        'noplaylist': settings.get('noplaylist', True),
+        # None keeps yt-dlp's default (~/.cache/yt-dlp)
+        'cachedir': settings.get('cachedir'),
+        # Fetch HLS/DASH fragments in parallel; no effect on single-file formats
+        'concurrent_fragment_downloads': settings.get('concurrent_fragment_downloads', 4),
+        'http_chunk_size': settings.get('http_chunk_size', 10485760),
+    }
+    # Multi-connection downloads through aria2c, only if enabled and installed
+    if settings.get('use_aria2c', False) and shutil.which('aria2c'):
+        opts['external_downloader'] = {'default': 'aria2c'}
+        opts['external_downloader_args'] = {'aria2c': ['-x', '8', '-s', '8', '-k', '1M']}
+    return opts
 
-# ============= TikTok Settings =============
-TIKTOK_SETTINGS = _config.get_section('tiktok')
 
-TIKTOK_MAX_RETRIES = TIKTOK_SETTINGS.get('max_retries', 3)
-TIKTOK_RETRY_BACKOFF = TIKTOK_SETTINGS.get('retry_backoff_base', 2)
-TIKTOK_ERROR_MESSAGE = TIKTOK_SETTINGS.get(
-    'error_message',
-    'Не удается загрузить видео с TikTok. Пожалуйста, проверьте ссылку и попробуйте позже.'
+# URL regex patterns; groups are non-capturing except the YouTube video ID
+YOUTUBE_REGEX = re.compile(
+    r'(?:https?://)?(?:www\.)?(?:youtube|youtu|youtube-nocookie)\.(?:com|be)/(?:watch\?v=|embed/|v/|shorts/|.+\?v=)?(?P<video_id>[^&=%\?]{11})'
 )
-
-# ============= Twitter/X Settings =============
-TWITTER_SETTINGS = _config.get_section('twitter')
-
-TWITTER_MAX_RETRIES = TWITTER_SETTINGS.get('max_retries', 3)
-TWITTER_RETRY_BACKOFF = TWITTER_SETTINGS.get('retry_backoff_base', 2)
-TWITTER_ERROR_MESSAGE = TWITTER_SETTINGS.get(
-    'error_message',
-    'Не удается загрузить видео с Twitter/X. Пожалуйста, проверьте ссылку и попробуйте позже.'
+TIKTOK_REGEX = re.compile(
+    r'(?:https?://)?(?:www\.|vm\.|vt\.)?tiktok\.com/\S+'
+)
+TWITTER_REGEX = re.compile(
+    r'(?:https?://)?(?:www\.|mobile\.)?(?:twitter\.com|x\.com)/\S+'
 )
 
-# ============= Bot Messages =============
-MESSAGES = _config.get_section('messages')
+# All supported platforms in a single pattern; the named group tells which one matched
+URL_REGEX = re.compile(
+    f'(?P<twitter>{TWITTER_REGEX.pattern})'
+    f'|(?P<tiktok>{TIKTOK_REGEX.pattern})'
+    f'|(?P<youtube>{YOUTUBE_REGEX.pattern})'
+)
 
-MSG_START = MESSAGES.get('start', 
+# Substrings at least one of which is contained in every URL_REGEX match
+_URL_HINTS = ('twitter.com', 'x.com', 'tiktok.com', 'youtu')
+
+
+def classify_url(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """Find the first supported platform URL in text.
+    
+    A plain substring check filters out texts that cannot match, then a
+    single pass of the combined URL_REGEX identifies the platform.
+    
+    Args:
+        text: Message text
+        
+    Returns:
+        Tuple of (platform, url) or (None, None) if nothing matched
+    """
+    if not any(hint in text for hint in _URL_HINTS):
+        return None, None
+    
+    match = URL_REGEX.search(text)
+    if match is None:
+        return None, None
+    return match.lastgroup, match.group(0)
+
+
+# Fallback bot messages used when config.yaml has no messages section
+_DEFAULT_MSG_START = (
     "👋 Привет! Я бот для скачивания видео и музыки с YouTube и TikTok.\n\n"
     "📺 **YouTube**: выбирайте качество видео и аудио\n"
     "🎵 **TikTok**: автоматическая загрузка видео\n\n"
     "Просто отправьте мне ссылку на видео!"
 )
 
-MSG_HELP = MESSAGES.get('help',
+_DEFAULT_MSG_HELP = (
     "🔍 **Как пользоваться ботом:**\n\n"
     "1. Отправьте ссылку на видео с YouTube, YouTube Shorts, TikTok или Twitter/X\n"
     "2. /search <запрос> - поиск видео на YouTube\n"
-    "3. /report - отправить报告 о проблеме\n"
+    "3. /report - отправить отчет о проблеме\n"
     "4. /stats - статистика бота\n\n"
     "📌 **Поддерживаемые платформы:**\n"
     "• YouTube (видео и аудио, выбор качества)\n"
@@ -111,3 +119,89 @@ MSG_HELP = MESSAGES.get('help',
     "• Twitter/X (видео, фото, альбомы)"
 )
 
+# Lazily resolved settings: name -> factory called on first access
+_LAZY_SETTINGS: Dict[str, Callable[[], Any]] = {
+    # ============= API credentials =============
+    'API_ID': lambda: int(_env("API_ID", 0)),
+    'API_HASH': lambda: _env("API_HASH"),
+    'BOT_TOKEN': lambda: _env("BOT_TOKEN"),
+    'SESSION_STRING': lambda: _env("SESSION_STRING", ""),
+
+    # ============= Video Settings =============
+    'VIDEO_SETTINGS': lambda: _section('video'),
+    'DEFAULT_VIDEO_WIDTH': lambda: _section('video').get('default_youtube_width', 1280),
+    'DEFAULT_VIDEO_HEIGHT': lambda: _section('video').get('default_youtube_height', 720),
+    'DEFAULT_TIKTOK_WIDTH': lambda: _section('video').get('default_tiktok_width', 720),
+    'DEFAULT_TIKTOK_HEIGHT': lambda: _section('video').get('default_tiktok_height', 1280),
+
+    # ============= Download Settings =============
+    'DOWNLOAD_SETTINGS': lambda: _section('downloads'),
+    'MAX_DOWNLOADS_PER_USER': lambda: _section('downloads').get('max_concurrent_per_user', 3),
+    'MAX_DOWNLOADS_TOTAL': lambda: _section('downloads').get('max_concurrent_total', 8),
+    'ADMIN_USER_IDS': lambda: set(_section('downloads').get('admin_user_ids', [])),
+    'UNLIMITED_USER_IDS': lambda: set(_section('downloads').get('unlimited_user_ids', [])),
+    # None uses the system temp directory
+    'DOWNLOAD_TEMP_DIR': lambda: _section('downloads').get('temp_dir'),
+
+    # ============= Audio Settings =============
+    'AUDIO_SETTINGS': lambda: _section('audio'),
+    'AUDIO_FORMAT': lambda: _section('audio').get('format', 'mp3'),
+    'AUDIO_BITRATE': lambda: _section('audio').get('default_bitrate', '192'),
+    'AUDIO_EMBED_THUMBNAIL': lambda: _section('audio').get('embed_thumbnail', False),
+    'AUDIO_QUALITY_SETTINGS': lambda: _section('audio').get('quality_presets', {
+        'high': 'bestaudio/best',
+        'medium': 'bestaudio[abr<=128]/bestaudio/best',
+        'low': 'bestaudio[abr<=96]/bestaudio/best',
+    }),
+
+    # ============= YT-DLP Settings =============
+    'YDLP_SETTINGS': lambda: _section('yt_dlp'),
+    'YDLP_BASE_OPTS': _ydlp_base_opts,
+    'YDLP_MAX_WORKERS': lambda: _section('yt_dlp').get('max_workers', 8),
+    'YDLP_INFO_WORKERS': lambda: _section('yt_dlp').get('info_workers', 4),
+
+    # ============= YouTube Settings =============
+    'YOUTUBE_SETTINGS': lambda: _section('youtube'),
+    'VIDEO_FALLBACK_QUALITIES': lambda: _section('youtube').get('video_fallback_qualities', [1080, 720, 480, 360, 240]),
+    'DEFAULT_SEARCH_RESULTS': lambda: _section('youtube').get('default_search_results', 5),
+
+    # ============= TikTok Settings =============
+    'TIKTOK_SETTINGS': lambda: _section('tiktok'),
+    'TIKTOK_MAX_RETRIES': lambda: _section('tiktok').get('max_retries', 3),
+    'TIKTOK_RETRY_BACKOFF': lambda: _section('tiktok').get('retry_backoff_base', 2),
+    'TIKTOK_RETRY_DEADLINE': lambda: _section('tiktok').get('retry_deadline_seconds', 60),
+    'TIKTOK_ERROR_MESSAGE': lambda: _section('tiktok').get(
+        'error_message',
+        'Не удается загрузить видео с TikTok. Пожалуйста, проверьте ссылку и попробуйте позже.'
+    ),
+
+    # ============= Twitter/X Settings =============
+    'TWITTER_SETTINGS': lambda: _section('twitter'),
+    'TWITTER_MAX_RETRIES': lambda: _section('twitter').get('max_retries', 3),
+    'TWITTER_RETRY_BACKOFF': lambda: _section('twitter').get('retry_backoff_base', 2),
+    'TWITTER_RETRY_DEADLINE': lambda: _section('twitter').get('retry_deadline_seconds', 60),
+    'TWITTER_ERROR_MESSAGE': lambda: _section('twitter').get(
+        'error_message',
+        'Не удается загрузить видео с Twitter/X. Пожалуйста, проверьте ссылку и попробуйте позже.'
+    ),
+
+    # ============= Bot Messages =============
+    'MESSAGES': lambda: _section('messages'),
+    'MSG_START': lambda: _section('messages').get('start') or _DEFAULT_MSG_START,
+    'MSG_HELP': lambda: _section('messages').get('help') or _DEFAULT_MSG_HELP,
+}
+
+
+def __getattr__(name: str) -> Any:
+    """Resolve lazy settings on first access and cache them as module globals."""
+    factory = _LAZY_SETTINGS.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = factory()
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """Include lazy settings in module introspection."""
+    return sorted(set(globals()) | set(_LAZY_SETTINGS))
@@ -1,11 +1,30 @@
 """Configuration loader for YAML config file."""
+import functools
 import logging
 import os
+import stat
 import yaml
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Prefer the libyaml-backed loader; it parses several times faster
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+if YAML_LOADER is yaml.SafeLoader:
+    logger.debug("libyaml is not available, using pure-Python YAML loader")
+
+# Common config locations, checked in order
+_CONFIG_CANDIDATES = (
+    'config.yaml',
+    '/mnt/d/prj/komuzik/config.yaml',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config.yaml'),
+)
+
+# Config lookups that found the first (preferred) candidate, keyed on the absolute
+# candidate paths; other results are not stored, so a config file created later
+# at a preferred location is still picked up
+_found_config_files: Dict[Tuple[str, ...], str] = {}
+
 
 class ConfigLoader:
     """Loads and manages application configuration from YAML file."""
@@ -20,38 +39,56 @@ class ConfigLoader:
         self.config = self._load_config()
     
     @staticmethod
-    def _find_config_file(config_path: str = None) -> str:
+    def _find_config_file(config_path: str = None) -> Optional[str]:
         """Find config file in common locations.
         
+        A hit on the preferred candidate is memoized per working directory;
+        fallbacks and misses are probed again on the next call.
+        
         Args:
             config_path: Explicit path to config file
             
         Returns:
             Path to config file if found, None otherwise
         """
-        if config_path and os.path.exists(config_path):
-            return config_path
+        candidates = (config_path,) + _CONFIG_CANDIDATES if config_path else _CONFIG_CANDIDATES
+        key = tuple(os.path.abspath(path) for path in candidates)
         
-        # Search in common locations
-        possible_paths = [
-            'config.yaml',
-            '/mnt/d/prj/komuzik/config.yaml',
-            os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config.yaml'),
-        ]
+        found = _found_config_files.get(key)
+        if found is not None:
+            return found
         
-        for path in possible_paths:
-            if os.path.exists(path):
-                return path
+        for path in key:
+            try:
+                if stat.S_ISREG(os.stat(path).st_mode):
+                    if path == key[0]:
+                        _found_config_files[key] = path
+                    return path
+            except OSError:
+                continue
         
         return None
     
     def _load_config(self) -> Dict[str, Any]:
-        """Load configuration from YAML file.
+        """Load configuration, parsing each config file at most once per process.
+        
+        The cache is keyed on the resolved absolute path, so relative and
+        absolute spellings of the same file share one entry.
         
         Returns:
             Configuration dictionary
         """
         config_path = self._find_config_file(self.config_path)
+        return _load_cached(os.path.realpath(config_path) if config_path else None)
+    
+    @classmethod
+    def _read_config(cls, config_path: Optional[str] = None) -> Dict[str, Any]:
+        """Load configuration from YAML file.
+        
+        Returns:
+            Configuration dictionary
+        """
+        config_path = cls._find_config_file(config_path)
         
         if config_path is None:
             logger.warning("Config file not found, using empty configuration")
@@ -59,9 +96,9 @@ class ConfigLoader:
         
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f) or {}
+                config = yaml.load(f, Loader=YAML_LOADER) or {}
                 logger.info(f"Configuration loaded from {config_path}")
-                return config
+            return config
         except FileNotFoundError:
             logger.warning(f"Config file not found at {config_path}, using empty configuration")
             return {}
@@ -102,3 +139,12 @@ class ConfigLoader:
             Dictionary with section configuration
         """
         return self.config.get(section, {})
+
+
+@functools.lru_cache(maxsize=8)
+def _load_cached(config_path: Optional[str]) -> Dict[str, Any]:
+    """Parse configuration once per resolved config path.
+    
+    Call ``_load_cached.cache_clear()`` to force a reload.
+    """
+    return ConfigLoader._read_config(config_path)
@@ -1,23 +1,43 @@
 """SQLite database module for statistics tracking."""
 import sqlite3
 import logging
+import queue
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Iterable, Iterator, Optional
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for a free pooled read connection before giving up
+READER_TIMEOUT = 30
+
 
 class Database:
-    """SQLite database manager for bot statistics."""
+    """SQLite database manager for bot statistics.
+    
+    Writes go through a single connection guarded by a lock; reads use a
+    pool of read-only connections, which WAL mode lets run concurrently
+    with the writer.
+    """
     
-    def __init__(self, db_path: str = "komuzik_stats.db"):
+    def __init__(self, db_path: str = "komuzik_stats.db", read_connections: int = 4):
         """Initialize database connection.
         
         Args:
             db_path: Path to the SQLite database file
+            read_connections: Number of pooled read-only connections
         """
         self.db_path = db_path
+        self.read_connections = read_connections
+        # Writer connection
         self.conn: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.RLock()
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        # Read connections opened by connect() and not yet closed
+        self._reader_count = 0
+        # Per-thread nesting depth of transaction() blocks
+        self._local = threading.local()
         
     def connect(self):
         """Establish database connection and create tables if needed."""
@@ -27,14 +47,40 @@ class Database:
             if db_dir != Path('.'):
                 db_dir.mkdir(parents=True, exist_ok=True)
             
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # sqlite3 keeps prepared statements per connection keyed by SQL text
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
             self.conn.row_factory = sqlite3.Row
+            self._configure_connection()
             logger.info(f"Connected to database: {self.db_path}")
             self._create_tables()
+            
+            for _ in range(self.read_connections):
+                self._readers.put(self._open_reader())
+                self._reader_count += 1
         except Exception as e:
             logger.error(f"Failed to connect to database: {e}")
             raise
     
+    def _configure_connection(self):
+        """Apply PRAGMAs tuned for frequent small writes.
+        
+        WAL journaling with synchronous=NORMAL avoids an fsync per commit.
+        """
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA mmap_size=268435456")
+        self.conn.execute("PRAGMA cache_size=-65536")
+    
+    def _open_reader(self) -> sqlite3.Connection:
+        """Open a read-only connection to the database file."""
+        uri = Path(self.db_path).absolute().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        return conn
+    
     def _create_tables(self):
         """Create database tables if they don't exist."""
         cursor = self.conn.cursor()
@@ -75,29 +121,76 @@ class Database:
             )
         ''')
         
+        # Internal bookkeeping (e.g. row count at the last ANALYZE)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS _meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            )
+        ''')
+        
+        # Replace the old single-column indexes with composite ones
+        for index_name in ('idx_statistics_event_type', 'idx_statistics_timestamp', 'idx_statistics_success'):
+            cursor.execute(f'DROP INDEX IF EXISTS {index_name}')
+        
         # Create indexes for better query performance
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_statistics_event_type 
-            ON statistics(event_type)
+            CREATE INDEX IF NOT EXISTS idx_stats_et_ts 
+            ON statistics(event_type, timestamp DESC, success)
         ''')
         
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_statistics_timestamp 
-            ON statistics(timestamp)
+            CREATE INDEX IF NOT EXISTS idx_stats_platform_ts 
+            ON statistics(platform, timestamp DESC)
         ''')
         
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_statistics_success 
-            ON statistics(success)
+            CREATE INDEX IF NOT EXISTS idx_users_last_seen 
+            ON users(last_seen)
         ''')
         
         self.conn.commit()
         logger.info("Database tables created successfully")
+        
+        self._analyze_if_needed()
+    
+    def _analyze_if_needed(self):
+        """Refresh planner statistics when the statistics table has grown.
+        
+        ANALYZE runs when the row count grew by more than 10% since the last
+        run, so the composite indexes keep being chosen as the table grows.
+        """
+        row_count = self.conn.execute("SELECT COUNT(*) FROM statistics").fetchone()[0]
+        if not row_count:
+            return
+        
+        analyzed = self.conn.execute(
+            "SELECT value FROM _meta WHERE key = 'analyzed_rows'"
+        ).fetchone()
+        if analyzed is not None and row_count <= analyzed[0] * 1.1:
+            return
+        
+        self.conn.execute("ANALYZE statistics")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO _meta (key, value) VALUES ('analyzed_rows', ?)",
+            (row_count,)
+        )
+        self.conn.commit()
+        logger.info(f"Database statistics analyzed ({row_count} rows)")
     
     def close(self):
-        """Close database connection."""
+        """Close database connections."""
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+            self._reader_count -= 1
+        
         if self.conn:
+            try:
+                self.conn.execute("PRAGMA optimize")
+            except sqlite3.Error as e:
+                logger.warning(f"PRAGMA optimize failed: {e}")
             self.conn.close()
+            self.conn = None
             logger.info("Database connection closed")
     
     def execute(self, query: str, params: tuple = ()):
@@ -110,35 +203,128 @@ class Database:
         Returns:
             Cursor object with query results
         """
-        cursor = self.conn.cursor()
-        cursor.execute(query, params)
-        self.conn.commit()
-        return cursor
+        with self.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            if not self._in_transaction():
+                conn.commit()
+            return cursor
     
-    def fetchone(self, query: str, params: tuple = ()):
+    def execute_many(self, query: str, seq_of_params: Iterable[tuple]):
+        """Execute a query for each parameter set with a single commit.
+        
+        Args:
+            query: SQL query to execute
+            seq_of_params: Iterable of query parameters
+            
+        Returns:
+            Cursor object
+        """
+        with self.writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(query, seq_of_params)
+            if not self._in_transaction():
+                conn.commit()
+            return cursor
+    
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Borrow the writer connection, serialized across threads."""
+        if self.conn is None:
+            raise RuntimeError("Database is not connected")
+        with self._write_lock:
+            yield self.conn
+    
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only connection from the pool.
+        
+        Inside a transaction() block the writer is used instead, so reads
+        see the transaction's uncommitted writes.
+        """
+        if self._in_transaction():
+            with self.writer() as conn:
+                yield conn
+            return
+        
+        if self._reader_count <= 0:
+            raise RuntimeError("Database is not connected")
+        try:
+            conn = self._readers.get(timeout=READER_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError(f"No free database read connection after {READER_TIMEOUT} seconds") from None
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+    
+    @contextmanager
+    def transaction(self):
+        """Group several writes into one commit.
+        
+        Nested blocks join the outermost transaction, which commits on
+        success and rolls back on error. The writer stays locked for the
+        whole block.
+        """
+        with self._write_lock:
+            depth = getattr(self._local, 'depth', 0)
+            self._local.depth = depth + 1
+            try:
+                yield self
+            except Exception:
+                if depth == 0:
+                    self.conn.rollback()
+                raise
+            else:
+                if depth == 0:
+                    self.conn.commit()
+            finally:
+                self._local.depth = depth
+    
+    def _in_transaction(self) -> bool:
+        """Check if the current thread is inside a transaction() block."""
+        return getattr(self._local, 'depth', 0) > 0
+    
+    def fetchone(
+        self,
+        query: str,
+        params: tuple = (),
+        row_factory: Optional[Callable[[sqlite3.Cursor, tuple], Any]] = sqlite3.Row
+    ):
         """Fetch one result from query.
         
         Args:
             query: SQL query to execute
             params: Query parameters
+            row_factory: Row factory for this query; None returns plain tuples
             
         Returns:
             Single row result or None
         """
-        cursor = self.conn.cursor()
-        cursor.execute(query, params)
-        return cursor.fetchone()
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            cursor.execute(query, params)
+            return cursor.fetchone()
     
-    def fetchall(self, query: str, params: tuple = ()):
+    def fetchall(
+        self,
+        query: str,
+        params: tuple = (),
+        row_factory: Optional[Callable[[sqlite3.Cursor, tuple], Any]] = sqlite3.Row
+    ):
         """Fetch all results from query.
         
         Args:
             query: SQL query to execute
             params: Query parameters
+            row_factory: Row factory for this query; None returns plain tuples
             
         Returns:
             List of row results
         """
-        cursor = self.conn.cursor()
-        cursor.execute(query, params)
-        return cursor.fetchall()
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            cursor.execute(query, params)
+            return cursor.fetchall()
@@ -1,8 +1,15 @@
 """Download limiter to control concurrent downloads per user."""
+import asyncio
+import heapq
 import logging
-from typing import Dict, Set
-import yaml
 import os
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, FrozenSet, List, Optional, Tuple
+
+from .config_loader import ConfigLoader
 
 logger = logging.getLogger(__name__)
 
@@ -10,74 +17,90 @@ logger = logging.getLogger(__name__)
 class DownloadLimiter:
     """Manages download limits for users based on configuration."""
     
-    def __init__(self, config_path: str = None):
+    __slots__ = (
+        'config',
+        'download_config',
+        'MAX_DOWNLOADS_PER_USER',
+        'UNLIMITED_USER_IDS',
+        'ADMIN_USER_IDS',
+        'DOWNLOAD_TIMEOUT',
+        'CLEANUP_INTERVAL',
+        '_unlimited_ids',
+        '_active_downloads',
+        '_owners',
+        '_expiry',
+        '_lock',
+    )
+    
+    def __init__(
+        self,
+        config_path: str = None,
+        unlimited_ids: Optional[FrozenSet[int]] = None,
+        max_per_user: Optional[int] = None
+    ):
         """Initialize the download limiter from config file.
         
         Args:
             config_path: Path to config.yaml file. If not provided, looks in parent directories.
+            unlimited_ids: User IDs without download limit (defaults to config unlimited_user_ids)
+            max_per_user: Concurrent downloads per user (defaults to config max_concurrent_per_user)
         """
         self.config = self._load_config(config_path)
         self.download_config = self.config.get('downloads', {})
         
         # Load settings from config
-        self.MAX_DOWNLOADS_PER_USER = self.download_config.get('max_concurrent_per_user', 1)
-        self.UNLIMITED_USER_IDS = set(self.download_config.get('unlimited_user_ids', []))
-        self.ADMIN_USER_IDS = set(self.download_config.get('admin_user_ids', []))
+        if max_per_user is None:
+            max_per_user = self.download_config.get('max_concurrent_per_user', 1)
+        if unlimited_ids is None:
+            unlimited_ids = frozenset(self.download_config.get('unlimited_user_ids', []))
+        self.MAX_DOWNLOADS_PER_USER = max_per_user
+        self.UNLIMITED_USER_IDS: FrozenSet[int] = frozenset(unlimited_ids)
+        self.ADMIN_USER_IDS: FrozenSet[int] = frozenset(self.download_config.get('admin_user_ids', []))
         self.DOWNLOAD_TIMEOUT = self.download_config.get('download_timeout_seconds', 3600)
         self.CLEANUP_INTERVAL = self.download_config.get('cleanup_interval_seconds', 300)
         
-        # Dictionary to track active downloads per user
-        # Key: user_id, Value: set of download identifiers
-        self._active_downloads: Dict[int, Set[str]] = {}
+        # Admins and unlimited users bypass the limit: one membership test
+        self._unlimited_ids: FrozenSet[int] = self.UNLIMITED_USER_IDS | self.ADMIN_USER_IDS
+        
+        # Number of active downloads per user
+        self._active_downloads: Counter = Counter()
+        # Owner of each active download: download_id -> user_id
+        self._owners: Dict[int, int] = {}
+        # Min-heap of (deadline, download_id) used to expire abandoned downloads
+        self._expiry: List[Tuple[float, int]] = []
+        # Makes check-and-increment atomic across threads
+        self._lock = threading.Lock()
         
         logger.info(
-            f"DownloadLimiter initialized: max_per_user={self.MAX_DOWNLOADS_PER_USER}, "
-            f"unlimited_users={self.UNLIMITED_USER_IDS}"
+            "DownloadLimiter initialized: max_per_user=%s, unlimited_users=%s",
+            self.MAX_DOWNLOADS_PER_USER, self.UNLIMITED_USER_IDS
         )
     
     @staticmethod
     def _load_config(config_path: str = None) -> dict:
         """Load configuration from YAML file.
         
+        Uses ConfigLoader, which parses each config file once per process.
+        An explicit path that does not exist gives an empty configuration
+        instead of falling back to the common locations.
+        
         Args:
             config_path: Path to config.yaml. If None, searches in common locations.
             
         Returns:
             Configuration dictionary
         """
-        # Determine config path
-        if config_path is None:
-            # Search in common locations
-            possible_paths = [
-                'config.yaml',
-                '/mnt/d/prj/komuzik/config.yaml',
-                os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config.yaml'),
-            ]
-            
-            for path in possible_paths:
-                if os.path.exists(path):
-                    config_path = path
-                    break
-            
-            if config_path is None:
-                logger.warning("Config file not found, using empty configuration")
-                return {}
-        
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f) or {}
-                logger.info(f"Configuration loaded from {config_path}")
-                return config
-        except FileNotFoundError:
+        if config_path is not None and not os.path.isfile(config_path):
             logger.warning(f"Config file not found at {config_path}, using empty configuration")
             return {}
-        except yaml.YAMLError as e:
-            logger.error(f"Error parsing YAML config: {e}")
-            return {}
+        return ConfigLoader(config_path).config
     
     def can_download(self, user_id: int) -> bool:
         """Check if user can start a new download.
         
+        The answer may be stale by the time a download starts; use
+        start_download() or slot() to check and register atomically.
+        
         Args:
             user_id: Telegram user ID
             
@@ -85,21 +108,24 @@ class DownloadLimiter:
             True if user can download, False otherwise
         """
         # Unlimited users (admins and unlimited_user_ids) can always download
-        if user_id in self.UNLIMITED_USER_IDS or user_id in self.ADMIN_USER_IDS:
+        if user_id in self._unlimited_ids:
             return True
         
         # Check if user has reached the limit
-        active_count = len(self._active_downloads.get(user_id, set()))
-        can_proceed = active_count < self.MAX_DOWNLOADS_PER_USER
-        
-        if not can_proceed:
-            logger.info(f"User {user_id} has reached download limit ({active_count}/{self.MAX_DOWNLOADS_PER_USER})")
+        active_count = self._active_downloads[user_id]
+        if active_count < self.MAX_DOWNLOADS_PER_USER:
+            return True
         
-        return can_proceed
+        logger.info("User %s has reached download limit (%d/%d)", user_id, active_count, self.MAX_DOWNLOADS_PER_USER)
+        return False
     
-    def start_download(self, user_id: int, download_id: str) -> bool:
+    def start_download(self, user_id: int, download_id: int) -> bool:
         """Register a new download for a user.
         
+        The limit check and the increment happen under one lock, so
+        concurrent callers cannot both pass the check and exceed the limit.
+        Unlimited users are not counted and return before taking the lock.
+        
         Args:
             user_id: Telegram user ID
             download_id: Unique identifier for this download
@@ -107,32 +133,141 @@ class DownloadLimiter:
         Returns:
             True if download was registered, False if limit reached
         """
-        if not self.can_download(user_id):
-            return False
+        if user_id in self._unlimited_ids:
+            return True
+        
+        with self._lock:
+            active_count = self._active_downloads[user_id]
+            acquired = active_count < self.MAX_DOWNLOADS_PER_USER
+            if acquired:
+                active_count += 1
+                self._active_downloads[user_id] = active_count
+                self._owners[download_id] = user_id
+                heapq.heappush(self._expiry, (time.monotonic() + self.DOWNLOAD_TIMEOUT, download_id))
         
-        if user_id not in self._active_downloads:
-            self._active_downloads[user_id] = set()
+        if not acquired:
+            logger.info("User %s has reached download limit (%d/%d)", user_id, active_count, self.MAX_DOWNLOADS_PER_USER)
+            return False
         
-        self._active_downloads[user_id].add(download_id)
-        logger.info(f"User {user_id} started download {download_id}. Active: {len(self._active_downloads[user_id])}")
+        logger.info("User %s started download %s. Active: %d", user_id, download_id, active_count)
         
         return True
     
-    def finish_download(self, user_id: int, download_id: str):
+    def finish_download(self, user_id: int, download_id: int):
         """Remove a download from active downloads.
         
+        Unknown or already finished download IDs are ignored. The slot is
+        released for the user recorded by start_download(); a different
+        user_id is logged as a caller bug.
+        
         Args:
             user_id: Telegram user ID
             download_id: Unique identifier for this download
         """
-        if user_id in self._active_downloads:
-            self._active_downloads[user_id].discard(download_id)
+        with self._lock:
+            released = self._release(download_id)
+            self._compact_expiry()
+        
+        if released is not None:
+            owner_id, active_count = released
+            if owner_id != user_id:
+                logger.warning(
+                    "Download %s belongs to user %s, not %s; releasing it for its owner",
+                    download_id, owner_id, user_id
+                )
+            logger.info("User %s finished download %s. Active: %d", owner_id, download_id, active_count)
+    
+    def _compact_expiry(self):
+        """Drop heap entries of finished downloads once they dominate the heap.
+        
+        Entries are not removed when a download finishes, so without this the
+        heap would hold every download of the last DOWNLOAD_TIMEOUT seconds.
+        The caller must hold the lock.
+        """
+        if len(self._expiry) <= 2 * len(self._owners) + 64:
+            return
+        self._expiry = [entry for entry in self._expiry if entry[1] in self._owners]
+        heapq.heapify(self._expiry)
+    
+    def _release(self, download_id: int) -> Optional[Tuple[int, int]]:
+        """Release a download slot; the caller must hold the lock.
+        
+        Args:
+            download_id: Unique identifier for this download
             
-            # Clean up empty sets
-            if not self._active_downloads[user_id]:
-                del self._active_downloads[user_id]
+        Returns:
+            Tuple of (user_id, remaining active count) or None if the download is unknown
+        """
+        user_id = self._owners.pop(download_id, None)
+        if user_id is None:
+            return None
+        
+        active_count = self._active_downloads[user_id] - 1
+        # Drop users without active downloads
+        if active_count:
+            self._active_downloads[user_id] = active_count
+        else:
+            del self._active_downloads[user_id]
+        return user_id, active_count
+    
+    def expire_stale(self) -> int:
+        """Release downloads that have been active longer than DOWNLOAD_TIMEOUT.
+        
+        Heap entries of downloads that already finished are discarded when
+        their deadline passes, if finish_download() has not compacted them away.
+        
+        Returns:
+            Number of downloads that were released
+        """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, download_id = heapq.heappop(self._expiry)
+                released = self._release(download_id)
+                if released is not None:
+                    expired.append((download_id, released[0]))
+        
+        for download_id, user_id in expired:
+            logger.warning("Download %s of user %s timed out, releasing its slot", download_id, user_id)
+        return len(expired)
+    
+    async def _cleanup_loop(self):
+        """Expire stale downloads every CLEANUP_INTERVAL seconds."""
+        while True:
+            await asyncio.sleep(self.CLEANUP_INTERVAL)
+            self.expire_stale()
+    
+    def start_cleanup(self) -> asyncio.Task:
+        """Start the periodic stale-download sweep on the running event loop.
+        
+        Returns:
+            The background task; cancel it on shutdown
+        """
+        return asyncio.create_task(self._cleanup_loop())
+    
+    @asynccontextmanager
+    async def slot(self, user_id: int, download_id: int) -> AsyncIterator[bool]:
+        """Hold a download slot for the duration of the ``async with`` block.
+        
+        Registering and releasing happen in one place, so call sites cannot
+        leak a slot or release one they never acquired.
+        
+        Args:
+            user_id: Telegram user ID
+            download_id: Unique identifier for this download
             
-            logger.info(f"User {user_id} finished download {download_id}. Active: {len(self._active_downloads.get(user_id, set()))}")
+        Yields:
+            True if the slot was acquired, False if the limit is reached
+        """
+        if not self.start_download(user_id, download_id):
+            yield False
+            return
+        
+        try:
+            yield True
+        finally:
+            self.finish_download(user_id, download_id)
     
     def get_active_count(self, user_id: int) -> int:
         """Get the number of active downloads for a user.
@@ -143,7 +278,7 @@ class DownloadLimiter:
         Returns:
             Number of active downloads
         """
-        return len(self._active_downloads.get(user_id, set()))
+        return self._active_downloads[user_id]
     
     def is_unlimited_user(self, user_id: int) -> bool:
         """Check if user has unlimited downloads.
@@ -154,7 +289,7 @@ class DownloadLimiter:
         Returns:
             True if user has unlimited downloads
         """
-        return user_id in self.UNLIMITED_USER_IDS or user_id in self.ADMIN_USER_IDS
+        return user_id in self._unlimited_ids
     
     def is_admin(self, user_id: int) -> bool:
         """Check if user is an admin.
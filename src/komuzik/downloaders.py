@@ -1,36 +1,216 @@
 """Download functionality for YouTube and TikTok content."""
 import asyncio
+import atexit
+import functools
 import logging
+import random
+import re
 import tempfile
+import threading
 import shutil
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import Tuple, List
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple, List
 import time
-import yt_dlp
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from telethon.tl.custom import Message
 from telethon.tl.types import DocumentAttributeAudio, DocumentAttributeVideo
 
-from .config import (
-    YDLP_BASE_OPTS,
-    AUDIO_QUALITY_SETTINGS,
-    AUDIO_FORMAT,
-    AUDIO_BITRATE,
-    VIDEO_FALLBACK_QUALITIES,
-    DEFAULT_VIDEO_WIDTH,
-    DEFAULT_VIDEO_HEIGHT,
-    DEFAULT_SEARCH_RESULTS,
-    TIKTOK_MAX_RETRIES,
-    TIKTOK_RETRY_BACKOFF,
-    TIKTOK_ERROR_MESSAGE,
-    TWITTER_MAX_RETRIES,
-    TWITTER_RETRY_BACKOFF,
-    TWITTER_ERROR_MESSAGE,
-)
+if TYPE_CHECKING:
+    import yt_dlp
+
+from . import config
+from .config import YOUTUBE_REGEX
 
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=1)
+def _ytdlp():
+    """Import yt_dlp on first use.
+    
+    Importing it loads the extractor registry, which is a noticeable part
+    of bot start-up and not needed until the first download or search.
+    """
+    import yt_dlp
+    return yt_dlp
+
+# yt-dlp errors that indicate a transient TikTok failure worth retrying
+_TIKTOK_RETRY_RE = re.compile(
+    r'Unable to extract|webpage|timed out|HTTP Error (?:429|5\d\d)|Connection (?:reset|aborted)'
+)
+
+# Upper bound for a single retry delay before jitter, in seconds
+RETRY_MAX_DELAY = 30
+
+# Output file name inside the download directory; yt-dlp fills in the fields
+_OUTPUT_NAME = '%(id)s.%(ext)s'
+
+# Per-mode yt-dlp options, built on first use from config.yaml; download
+# functions copy them and set format/outtmpl
+@functools.lru_cache(maxsize=1)
+def _yt_video_opts() -> Dict[str, Any]:
+    """yt-dlp options for YouTube video downloads."""
+    return {
+        **config.YDLP_BASE_OPTS,
+        'postprocessors': [
+            {
+                'key': 'FFmpegVideoConvertor',
+                'preferedformat': 'mp4',
+            },
+            {'key': 'FFmpegMetadata', 'add_metadata': True},
+        ],
+        'merge_output_format': 'mp4',
+    }
+
+
+@functools.lru_cache(maxsize=2)
+def _yt_audio_opts(embed_thumbnail: bool) -> Dict[str, Any]:
+    """yt-dlp options for YouTube audio downloads.
+    
+    Cover art costs one more HTTP request for the thumbnail and one more
+    ffmpeg pass, so it is only added when embed_thumbnail is set.
+    """
+    postprocessors = [
+        {'key': 'FFmpegExtractAudio', 'preferredcodec': config.AUDIO_FORMAT, 'preferredquality': config.AUDIO_BITRATE},
+        {'key': 'FFmpegMetadata', 'add_metadata': True},
+    ]
+    opts = {**config.YDLP_BASE_OPTS, 'postprocessors': postprocessors}
+    if embed_thumbnail:
+        postprocessors.append({'key': 'EmbedThumbnail'})
+        opts['writethumbnail'] = True
+    return opts
+
+
+@functools.lru_cache(maxsize=1)
+def _direct_video_opts() -> Dict[str, Any]:
+    """yt-dlp options for TikTok and Twitter/X: single best file, named by video ID."""
+    return {
+        **config.YDLP_BASE_OPTS,
+        'format': 'best',
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def _search_opts() -> Dict[str, Any]:
+    """Flat search: entries carry only id/title/duration/channel, no per-video requests."""
+    return {
+        **config.YDLP_BASE_OPTS,
+        'extract_flat': 'in_playlist',
+        'skip_download': True,
+        'default_search': 'ytsearch',
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def _prewarm_opts() -> Dict[str, Any]:
+    """Background metadata prefetch for search results.
+    
+    A short network timeout keeps a stalled request from holding a yt-dlp
+    worker for long.
+    """
+    return {
+        **config.YDLP_BASE_OPTS,
+        'socket_timeout': 3,
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def _ydl_executor() -> ThreadPoolExecutor:
+    """Executor for blocking yt-dlp downloads, separate from the default one shared with other I/O."""
+    if config.YDLP_MAX_WORKERS < config.MAX_DOWNLOADS_TOTAL:
+        logger.warning(
+            f"yt_dlp.max_workers ({config.YDLP_MAX_WORKERS}) is below downloads.max_concurrent_total "
+            f"({config.MAX_DOWNLOADS_TOTAL}); some admitted downloads will wait for a worker"
+        )
+    return ThreadPoolExecutor(max_workers=config.YDLP_MAX_WORKERS, thread_name_prefix='ytdlp')
+
+
+@functools.lru_cache(maxsize=1)
+def _ydl_info_executor() -> ThreadPoolExecutor:
+    """Executor for metadata extraction and search, so long downloads cannot hold up quick lookups."""
+    return ThreadPoolExecutor(max_workers=config.YDLP_INFO_WORKERS, thread_name_prefix='ytdlp-info')
+
+
+# YoutubeDL is not thread-safe, so each worker thread keeps its own instances
+# keyed by their frozen options, see _get_ydl()
+_ydl_local = threading.local()
+
+# Every instance created by _get_ydl(), so they can be closed at exit
+_ydl_instances: List['yt_dlp.YoutubeDL'] = []
+_ydl_instances_lock = threading.Lock()
+
+# Thumbnail extensions skipped when looking for the downloaded media file
+THUMBNAIL_EXTENSIONS = frozenset({'.jpg', '.png', '.webp'})
+
+
+class _TTLCache:
+    """Small LRU mapping whose entries expire a fixed time after being stored."""
+    
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: Any) -> Any:
+        """Get a live entry or None."""
+        cached = self._data.get(key)
+        if cached is None:
+            return None
+        if cached[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return cached[1]
+    
+    def set(self, key: Any, value: Any):
+        """Store an entry, evicting the least recently used ones over maxsize."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def clear(self):
+        """Drop all entries."""
+        self._data.clear()
+
+
+# Extracted info is reused for a while so that listing formats and then
+# downloading the chosen one does not hit YouTube twice; stream URLs in
+# the info eventually stop working, so entries expire after 10 minutes
+_info_cache = _TTLCache(ttl=600, maxsize=128)
+
+# Query parameters that do not change which video a URL points to
+_TRACKING_PARAMS = frozenset({'si', 'feature', 'pp', 'fbclid', 'gclid'})
+
+# Search results change slowly; repeated queries within 5 minutes are served from memory
+_search_cache = _TTLCache(ttl=300, maxsize=256)
+
+# Number of top search results whose info is fetched in the background
+PREWARM_RESULTS = 3
+
+# At most two prefetches run at once, bot-wide
+_prewarm_semaphore = asyncio.Semaphore(2)
+
+# Strong references to running prefetch tasks so they are not garbage collected
+_prewarm_tasks: set = set()
+
+
+def _retry_delay(backoff_base: float, attempt: int) -> float:
+    """Exponential backoff with jitter, so parallel retries do not fire in lockstep.
+    
+    Args:
+        backoff_base: Base of the exponential backoff
+        attempt: Zero-based number of the failed attempt
+        
+    Returns:
+        Seconds to wait before the next attempt
+    """
+    return min(backoff_base ** attempt, RETRY_MAX_DELAY) * (0.5 + random.random())
+
+
 def _find_downloaded_file(temp_dir: str, expected_extension: str = None, allow_images: bool = False) -> str:
     """Find and verify downloaded file in temp directory.
     
@@ -45,99 +225,325 @@ def _find_downloaded_file(temp_dir: str, expected_extension: str = None, allow_i
     Raises:
         Exception: If no files found, no valid media files, or file is empty
     """
-    files = os.listdir(temp_dir)
-    if not files:
+    suffix = f'.{expected_extension}' if expected_extension else None
+    seen_files = False
+    entry = None
+    
+    # Single pass: stop at the first file with the expected extension,
+    # otherwise remember the first media file as a fallback
+    with os.scandir(temp_dir) as it:
+        for candidate in it:
+            seen_files = True
+            # Skip thumbnails unless allow_images is True
+            if not allow_images and os.path.splitext(candidate.name)[1].lower() in THUMBNAIL_EXTENSIONS:
+                continue
+            if suffix is None or candidate.name.endswith(suffix):
+                entry = candidate
+                break
+            if entry is None:
+                entry = candidate
+    
+    if not seen_files:
         raise Exception("No files downloaded")
+    if entry is None:
+        raise Exception("No media file found in download directory")
     
-    # Filter out thumbnails unless allow_images is True
-    if allow_images:
-        media_files = [f for f in files]
-    else:
-        media_files = [f for f in files if not f.endswith(('.jpg', '.png', '.webp'))]
+    # Verify file is not empty; DirEntry caches the stat result
+    if entry.stat().st_size == 0:
+        raise Exception("The downloaded file is empty")
     
-    # If expected extension specified, try to find file with that extension first
-    if expected_extension:
-        exact_match = [f for f in media_files if f.endswith(f'.{expected_extension}')]
-        if exact_match:
-            media_files = exact_match
+    return entry.path
+
+
+def _resolve_downloaded_file(file_path: Optional[str], temp_dir: str, expected_extension: str = None) -> str:
+    """Use the path reported by yt-dlp, scanning temp_dir only if it is unusable.
     
-    if not media_files:
-        raise Exception("No media file found in download directory")
+    Args:
+        file_path: Final file path reported by yt-dlp, if any
+        temp_dir: Download directory to scan as a fallback
+        expected_extension: Optional expected file extension for the fallback scan
+        
+    Returns:
+        Full path to the downloaded file
+        
+    Raises:
+        Exception: If no valid media file is found or it is empty
+    """
+    if file_path:
+        try:
+            if os.stat(file_path).st_size > 0:
+                return file_path
+        except OSError:
+            pass
+    return _find_downloaded_file(temp_dir, expected_extension)
+
+
+def _wipe_dir(temp_dir: str):
+    """Remove everything inside a directory in a single scan, keeping the directory.
     
-    file_path = os.path.join(temp_dir, media_files[0])
+    Args:
+        temp_dir: Directory to empty
+    """
+    with os.scandir(temp_dir) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+async def _run_in_ydl_thread(func: Callable, *args) -> Any:
+    """Run a blocking yt-dlp download on the download executor.
     
-    # Verify file is not empty
-    if os.path.getsize(file_path) == 0:
-        raise Exception("The downloaded file is empty")
+    Args:
+        func: Blocking callable
+        *args: Positional arguments for func
+        
+    Returns:
+        Whatever func returns
+    """
+    return await asyncio.get_running_loop().run_in_executor(_ydl_executor(), func, *args)
+
+
+async def _run_in_info_thread(func: Callable, *args) -> Any:
+    """Run a blocking yt-dlp metadata or search call on the info executor.
     
-    return file_path
+    Args:
+        func: Blocking callable
+        *args: Positional arguments for func
+        
+    Returns:
+        Whatever func returns
+    """
+    return await asyncio.get_running_loop().run_in_executor(_ydl_info_executor(), func, *args)
+
+
+def _freeze(value):
+    """Turn nested option dicts and lists into a hashable pool key."""
+    if isinstance(value, dict):
+        return frozenset((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _get_ydl(opts: dict) -> 'yt_dlp.YoutubeDL':
+    """Get the calling thread's long-lived YoutubeDL instance for the given options.
+    
+    Building a YoutubeDL sets up the extractor registry, cookie jar and
+    HTTP connection pool, so instances used with fixed options (metadata
+    extraction, search) are kept and reused. YoutubeDL keeps per-call
+    state, so an instance is only ever used by the thread that created it.
+    Downloads set a per-call outtmpl and keep their own instances.
+    
+    Args:
+        opts: yt-dlp options; the instance gets its own copy
+        
+    Returns:
+        YoutubeDL instance of the current thread, closed at interpreter exit
+    """
+    pool = getattr(_ydl_local, 'pool', None)
+    if pool is None:
+        pool = _ydl_local.pool = {}
+    
+    key = _freeze(opts)
+    ydl = pool.get(key)
+    if ydl is None:
+        ydl = pool[key] = _ytdlp().YoutubeDL(dict(opts))
+        with _ydl_instances_lock:
+            _ydl_instances.append(ydl)
+    return ydl
+
+
+def _extract_info_blocking(opts: dict, url: str) -> dict:
+    """Extract info without downloading, on the calling worker thread.
+    
+    The YoutubeDL instance is looked up here rather than by the caller, so
+    it belongs to the thread that runs the extraction.
+    
+    Args:
+        opts: yt-dlp options
+        url: Video URL or search query
+        
+    Returns:
+        yt-dlp info dict
+    """
+    return _get_ydl(opts).extract_info(url, download=False)
+
+
+@atexit.register
+def _close_ydl_pool():
+    """Close pooled YoutubeDL instances."""
+    with _ydl_instances_lock:
+        instances = _ydl_instances[:]
+        _ydl_instances.clear()
+    for ydl in instances:
+        ydl.close()
+
+
+def _cache_key(url: str) -> str:
+    """Canonical cache key for a video URL.
+    
+    YouTube URLs map to their video ID, so watch, youtu.be, shorts and
+    share links to one video share a cache entry. Other URLs lose their
+    fragment and tracking parameters.
+    """
+    match = YOUTUBE_REGEX.search(url)
+    if match:
+        return f"youtube:{match.group('video_id')}"
+    
+    parts = urlsplit(url)
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in _TRACKING_PARAMS and not key.startswith('utm_')
+    ]
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+
+async def _extract_info(url: str) -> dict:
+    """Extract video info without downloading, reusing recent results.
+    
+    The returned dict is shared and must be treated as read-only.
+    
+    Args:
+        url: Video URL
+        
+    Returns:
+        yt-dlp info dict
+    """
+    key = _cache_key(url)
+    info = _info_cache.get(key)
+    if info is None:
+        info = await _run_in_info_thread(_extract_info_blocking, config.YDLP_BASE_OPTS, url)
+        _info_cache.set(key, info)
+    return info
+
+
+async def _prewarm_info(url: str):
+    """Fill the info cache for a URL in the background, ignoring failures."""
+    key = _cache_key(url)
+    async with _prewarm_semaphore:
+        if _info_cache.get(key) is not None:
+            return
+        try:
+            info = await _run_in_info_thread(_extract_info_blocking, _prewarm_opts(), url)
+        except Exception as e:
+            logger.debug(f"Prefetch failed for {url}: {e}")
+            return
+        _info_cache.set(key, info)
+
+
+def _schedule_prewarm(results: List[dict]):
+    """Start background info prefetch for the top search results."""
+    for result in results[:PREWARM_RESULTS]:
+        task = asyncio.create_task(_prewarm_info(result['url']))
+        _prewarm_tasks.add(task)
+        task.add_done_callback(_prewarm_tasks.discard)
+
+
+def clear_cache():
+    """Forget cached video info and search results."""
+    _info_cache.clear()
+    _search_cache.clear()
+
+
+@functools.lru_cache(maxsize=1)
+def _download_temp_dir() -> Optional[str]:
+    """Get the configured downloads.temp_dir, creating it if needed.
+    
+    Returns:
+        Directory for download temp dirs, or None for the system temp directory
+        if none is configured or the configured one cannot be created
+    """
+    temp_dir = config.DOWNLOAD_TEMP_DIR
+    if not temp_dir:
+        return None
+    try:
+        os.makedirs(temp_dir, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Cannot use downloads.temp_dir {temp_dir!r} ({e}), using the system temp directory")
+        return None
+    return temp_dir
 
 
 @asynccontextmanager
 async def temp_directory():
-    """Context manager for temporary directory cleanup."""
-    temp_dir = tempfile.mkdtemp()
+    """Context manager for temporary directory cleanup.
+    
+    Download functions write into a directory owned by the caller, which
+    removes it here once the file has been sent or the download failed.
+    Removal runs in a worker thread so large trees do not block the event loop.
+    The directory is created under downloads.temp_dir when it is configured
+    (e.g. /dev/shm to keep downloads in RAM until they are uploaded).
+    """
+    temp_dir = tempfile.mkdtemp(prefix='komuzik_', dir=_download_temp_dir())
     try:
         yield temp_dir
     finally:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        await asyncio.to_thread(shutil.rmtree, temp_dir, ignore_errors=True)
 
 
 async def get_available_formats(url: str) -> List[int]:
     """Get available video formats for a YouTube URL."""
     try:
-        with yt_dlp.YoutubeDL(YDLP_BASE_OPTS) as ydl:
-            info = await asyncio.get_event_loop().run_in_executor(None, ydl.extract_info, url, False)
-            formats = info.get('formats', [])
-            
-            available_heights = set()
-            for fmt in formats:
-                height = fmt.get('height')
-                vcodec = fmt.get('vcodec', 'none')
-                if height and vcodec and vcodec != 'none':
-                    available_heights.add(height)
-            
-            if not available_heights:
-                logger.warning(f"No specific heights found for {url}, using fallback")
-                return VIDEO_FALLBACK_QUALITIES
-            
-            return sorted(available_heights, reverse=True)
+        info = await _extract_info(url)
+        formats = info.get('formats', [])
+        
+        # Heights of formats that carry a video stream
+        available_heights = {
+            height for fmt in formats
+            if (height := fmt.get('height')) and (vcodec := fmt.get('vcodec')) and vcodec != 'none'
+        }
+        
+        if not available_heights:
+            logger.warning(f"No specific heights found for {url}, using fallback")
+            return config.VIDEO_FALLBACK_QUALITIES
+        
+        return sorted(available_heights, reverse=True)
     except Exception as e:
         logger.error(f"Error getting available formats: {e}")
-        return VIDEO_FALLBACK_QUALITIES
+        return config.VIDEO_FALLBACK_QUALITIES
 
 
-async def search_youtube(query: str, max_results: int = DEFAULT_SEARCH_RESULTS) -> List[dict]:
-    """Search for YouTube videos and return top results."""
+async def search_youtube(query: str, max_results: Optional[int] = None) -> List[dict]:
+    """Search for YouTube videos and return top results.
+    
+    Info for the top results is prefetched in the background, so picking
+    one of them does not wait for a second extraction.
+    """
+    if max_results is None:
+        max_results = config.DEFAULT_SEARCH_RESULTS
+    search_query = f"ytsearch{max_results}:{query}"
+    # Queries differing only in case or spacing share a cache entry
+    cache_key = (' '.join(query.split()).casefold(), max_results)
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        _schedule_prewarm(cached)
+        return cached
+    
     try:
-        ydl_opts = {
-            **YDLP_BASE_OPTS,
-            'extract_flat': True,
-            'default_search': 'ytsearch',
-        }
-        
-        search_query = f"ytsearch{max_results}:{query}"
+        search_results = await _run_in_info_thread(_extract_info_blocking, _search_opts(), search_query)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            search_results = await asyncio.get_event_loop().run_in_executor(
-                None, ydl.extract_info, search_query, False
-            )
-            
-            results = []
-            for entry in search_results.get('entries', []):
-                results.append({
-                    'id': entry.get('id', ''),
-                    'title': entry.get('title', 'Unknown'),
-                    'url': f"https://www.youtube.com/watch?v={entry.get('id', '')}",
-                    'duration': entry.get('duration', 0),
-                    'channel': entry.get('channel', 'Unknown')
-                })
-            
-            return results
+        results = [
+            {
+                'id': (video_id := entry.get('id', '')),
+                'title': entry.get('title', 'Unknown'),
+                'url': f"https://www.youtube.com/watch?v={video_id}",
+                'duration': entry.get('duration', 0),
+                'channel': entry.get('channel') or entry.get('uploader') or 'Unknown'
+            }
+            for entry in search_results.get('entries') or ()
+        ]
     except Exception as e:
         logger.error(f"Error searching YouTube: {e}")
         return []
+    
+    _search_cache.set(cache_key, results)
+    _schedule_prewarm(results)
+    return results
 
 
 def _extract_metadata(info: dict, title: str) -> Tuple[str, str]:
@@ -146,159 +552,172 @@ def _extract_metadata(info: dict, title: str) -> Tuple[str, str]:
     track = info.get('track') or title
     
     # Try to parse "Artist - Track" format from title if no artist metadata
-    if artist == 'Unknown Artist' and ' - ' in title:
-        parts = title.split(' - ', 1)
-        artist = parts[0].strip()
-        track = parts[1].strip()
+    if artist == 'Unknown Artist':
+        head, separator, tail = title.partition(' - ')
+        if separator:
+            artist = head.strip()
+            track = tail.strip()
     
     return artist, track
 
 
+# Format used for 'best' and any quality that is not a '<height>p' string
+BEST_VIDEO_FORMAT = 'bestvideo+bestaudio/best'
+
+# '<height>p' quality strings; qualities come from callback data, which clients can forge
+_VIDEO_QUALITY_RE = re.compile(r'(\d{1,4})p', re.ASCII)
+
+
+@functools.lru_cache(maxsize=32)
 def _build_video_format(quality: str) -> str:
     """Build format string for video download."""
-    try:
-        if quality.endswith('p'):
-            height = int(quality[:-1])
-            return f'bestvideo[height<={height}]+bestaudio/best[height<={height}]/bestvideo+bestaudio/best'
-        else:
-            return 'bestvideo+bestaudio/best'
-    except (ValueError, AttributeError):
-        return 'bestvideo+bestaudio/best'
+    match = _VIDEO_QUALITY_RE.fullmatch(quality or '')
+    if match is None:
+        return BEST_VIDEO_FORMAT
+    
+    height = int(match.group(1))
+    return f'bestvideo[height<={height}]+bestaudio/best[height<={height}]/{BEST_VIDEO_FORMAT}'
 
 
-async def _download_content(url: str, temp_dir: str, ydl_opts: dict) -> Tuple[str, dict]:
-    """Download content using yt-dlp and return file path and info."""
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = await asyncio.get_event_loop().run_in_executor(None, ydl.extract_info, url, False)
-        await asyncio.get_event_loop().run_in_executor(None, ydl.download, [url])
-        return temp_dir, info
+def _download_extracted(ydl_opts: dict, info: dict) -> Optional[str]:
+    """Download an already extracted video without fetching its page again.
+    
+    ``ydl.download([url])`` would repeat the extraction (page fetch and
+    signature deciphering); processing the existing info dict skips it.
+    
+    Args:
+        ydl_opts: yt-dlp options for the download (format, outtmpl, postprocessors)
+        info: Info dict returned by ``extract_info(url, download=False)``
+        
+    Returns:
+        Final file path after postprocessing, or None if yt-dlp did not report one
+    """
+    with _ytdlp().YoutubeDL(ydl_opts) as ydl:
+        result = ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=True)
+    return _downloaded_path(result)
 
 
-async def download_youtube_video(url: str, quality: str = 'best') -> Tuple[str, dict]:
-    """Download a YouTube video and return the path and metadata."""
-    temp_dir = tempfile.mkdtemp()
+def _extract_and_download(ydl_opts: dict, url: str) -> dict:
+    """Extract and download a video in one pass, entirely on the calling worker thread.
     
-    try:
-        # Get info first
-        with yt_dlp.YoutubeDL(YDLP_BASE_OPTS) as ydl:
-            info = await asyncio.get_event_loop().run_in_executor(None, ydl.extract_info, url, False)
-        
-        video_id = info.get('id', '')
-        format_option = _build_video_format(quality)
-        
-        ydl_opts = {
-            **YDLP_BASE_OPTS,
-            'format': format_option,
-            'outtmpl': f'{temp_dir}/{video_id}.%(ext)s',
-            'postprocessors': [
-                {
-                    'key': 'FFmpegVideoConvertor',
-                    'preferedformat': 'mp4',
-                },
-                {'key': 'FFmpegMetadata', 'add_metadata': True},
-            ],
-            'merge_output_format': 'mp4',
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            await asyncio.get_event_loop().run_in_executor(None, ydl.download, [url])
-        
-        # Find the downloaded file
-        file_path = _find_downloaded_file(temp_dir, expected_extension='mp4')
-        
-        metadata = {
-            'title': info.get('title', 'Unknown'),
-            'duration': info.get('duration', 0),
-            'width': info.get('width', 0),
-            'height': info.get('height', 0),
-        }
+    Args:
+        ydl_opts: yt-dlp options for the download (format, outtmpl)
+        url: Video URL
         
-        return file_path, metadata
-    except Exception:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        raise
+    Returns:
+        Info dict of the downloaded video
+    """
+    with _ytdlp().YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=True)
 
 
-async def download_youtube_audio(url: str, quality: str = 'high') -> Tuple[str, dict]:
-    """Download YouTube audio and return the path and metadata."""
-    temp_dir = tempfile.mkdtemp()
+def _downloaded_path(info: dict) -> Optional[str]:
+    """Get the final file path yt-dlp recorded for a downloaded video.
     
-    try:
-        # Get info first
-        with yt_dlp.YoutubeDL(YDLP_BASE_OPTS) as ydl:
-            info = await asyncio.get_event_loop().run_in_executor(None, ydl.extract_info, url, False)
-        
-        video_id = info.get('id', '')
-        title = info.get('title', 'Unknown')
-        artist, track = _extract_metadata(info, title)
-        
-        format_option = AUDIO_QUALITY_SETTINGS.get(quality, AUDIO_QUALITY_SETTINGS['high'])
-        
-        ydl_opts = {
-            **YDLP_BASE_OPTS,
-            'format': format_option,
-            'outtmpl': f'{temp_dir}/{video_id}.%(ext)s',
-            'postprocessors': [
-                {'key': 'FFmpegExtractAudio', 'preferredcodec': AUDIO_FORMAT, 'preferredquality': AUDIO_BITRATE},
-                {'key': 'FFmpegMetadata', 'add_metadata': True},
-                {'key': 'EmbedThumbnail'}
-            ],
-            'writethumbnail': True,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            await asyncio.get_event_loop().run_in_executor(None, ydl.download, [url])
-        
-        # Find the downloaded audio file
-        file_path = _find_downloaded_file(temp_dir, AUDIO_FORMAT)
-        
-        metadata = {
-            'title': title,
-            'artist': artist,
-            'track': track,
-            'duration': info.get('duration', 0),
-        }
+    Args:
+        info: Info dict returned after a download
         
-        return file_path, metadata
-    except Exception:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        raise
+    Returns:
+        Path after postprocessing, or None if yt-dlp did not report one
+    """
+    downloads = info.get('requested_downloads') or ()
+    return downloads[-1].get('filepath') if downloads else None
+
+
+async def download_youtube_video(url: str, temp_dir: str, quality: str = 'best') -> Tuple[str, dict]:
+    """Download a YouTube video into temp_dir and return the path and metadata."""
+    # Get info first
+    info = await _extract_info(url)
+    
+    format_option = _build_video_format(quality)
+    
+    ydl_opts = _yt_video_opts().copy()
+    ydl_opts['format'] = format_option
+    ydl_opts['outtmpl'] = os.path.join(temp_dir, _OUTPUT_NAME)
+    
+    downloaded_path = await _run_in_ydl_thread(_download_extracted, ydl_opts, info)
+    file_path = _resolve_downloaded_file(downloaded_path, temp_dir, 'mp4')
+    
+    metadata = {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'width': info.get('width', 0),
+        'height': info.get('height', 0),
+    }
+    
+    return file_path, metadata
 
 
-async def download_tiktok_video(url: str, max_retries: int = None) -> Tuple[str, dict]:
+async def download_youtube_audio(
+    url: str,
+    temp_dir: str,
+    quality: str = 'high',
+    embed_thumbnail: bool = None
+) -> Tuple[str, dict]:
+    """Download YouTube audio into temp_dir and return the path and metadata.
+    
+    Args:
+        url: YouTube video URL
+        temp_dir: Caller-owned directory to download into
+        quality: Audio quality preset name
+        embed_thumbnail: Embed the video thumbnail as cover art (uses config default if None)
+    """
+    if embed_thumbnail is None:
+        embed_thumbnail = config.AUDIO_EMBED_THUMBNAIL
+    
+    # Get info first
+    info = await _extract_info(url)
+    
+    title = info.get('title', 'Unknown')
+    artist, track = _extract_metadata(info, title)
+    
+    format_option = config.AUDIO_QUALITY_SETTINGS.get(quality, config.AUDIO_QUALITY_SETTINGS['high'])
+    
+    ydl_opts = _yt_audio_opts(bool(embed_thumbnail)).copy()
+    ydl_opts['format'] = format_option
+    ydl_opts['outtmpl'] = os.path.join(temp_dir, _OUTPUT_NAME)
+    
+    downloaded_path = await _run_in_ydl_thread(_download_extracted, ydl_opts, info)
+    file_path = _resolve_downloaded_file(downloaded_path, temp_dir, config.AUDIO_FORMAT)
+    
+    metadata = {
+        'title': title,
+        'artist': artist,
+        'track': track,
+        'duration': info.get('duration', 0),
+    }
+    
+    return file_path, metadata
+
+
+async def download_tiktok_video(url: str, temp_dir: str, max_retries: int = None) -> Tuple[str, dict]:
     """Download a TikTok video and return the path and metadata.
     
     Includes retry logic for transient extraction failures.
     
     Args:
         url: TikTok video URL
+        temp_dir: Caller-owned directory to download into
         max_retries: Maximum number of retry attempts (uses config default if None)
         
     Raises:
         Exception: If download fails after all retries
     """
     if max_retries is None:
-        max_retries = TIKTOK_MAX_RETRIES
+        max_retries = config.TIKTOK_MAX_RETRIES
     
-    temp_dir = tempfile.mkdtemp()
-    last_error = None
+    # Retries stop early rather than sleep past this point
+    deadline = time.monotonic() + config.TIKTOK_RETRY_DEADLINE
     
     for attempt in range(max_retries):
         try:
-            ydl_opts = {
-                **YDLP_BASE_OPTS,
-                'format': 'best',
-                'outtmpl': f'{temp_dir}/%(id)s.%(ext)s',
-            }
+            ydl_opts = _direct_video_opts().copy()
+            ydl_opts['outtmpl'] = os.path.join(temp_dir, _OUTPUT_NAME)
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = await asyncio.get_event_loop().run_in_executor(None, ydl.extract_info, url, False)
-                await asyncio.get_event_loop().run_in_executor(None, ydl.download, [url])
+            # Extract and download in one pass
+            info = await _run_in_ydl_thread(_extract_and_download, ydl_opts, url)
             
-            # Find the downloaded file
-            file_path = _find_downloaded_file(temp_dir)
+            file_path = _resolve_downloaded_file(_downloaded_path(info), temp_dir)
             
             metadata = {
                 'duration': int(info.get('duration', 0)),
@@ -308,56 +727,48 @@ async def download_tiktok_video(url: str, max_retries: int = None) -> Tuple[str,
             
             return file_path, metadata
             
-        except yt_dlp.utils.DownloadError as e:
+        except _ytdlp().utils.DownloadError as e:
             error_msg = str(e)
-            last_error = e
             
             # Check if it's an extraction error (likely temporary)
-            if 'Unable to extract' in error_msg or 'webpage' in error_msg:
-                if attempt < max_retries - 1:
-                    wait_time = TIKTOK_RETRY_BACKOFF ** attempt  # Exponential backoff
+            if _TIKTOK_RETRY_RE.search(error_msg):
+                wait_time = _retry_delay(config.TIKTOK_RETRY_BACKOFF, attempt)
+                if attempt < max_retries - 1 and time.monotonic() + wait_time < deadline:
                     logger.warning(
                         f"TikTok extraction failed (attempt {attempt + 1}/{max_retries}). "
-                        f"Retrying in {wait_time}s... Error: {error_msg}"
+                        f"Retrying in {wait_time:.1f}s... Error: {error_msg}"
                     )
                     await asyncio.sleep(wait_time)
                     continue
                 else:
                     logger.error(
-                        f"TikTok video extraction failed after {max_retries} attempts. "
+                        f"TikTok video extraction failed after {attempt + 1} attempts. "
                         f"This may be due to: 1) TikTok API changes, 2) Region restrictions, "
                         f"3) Video unavailability. URL: {url}"
                     )
-                    if os.path.exists(temp_dir):
-                        shutil.rmtree(temp_dir)
-                    raise Exception(TIKTOK_ERROR_MESSAGE)
+                    raise Exception(config.TIKTOK_ERROR_MESSAGE) from e
             else:
                 # Not a temporary extraction error, fail immediately
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-                raise Exception(f"TikTok download error: {error_msg}")
+                raise Exception(f"TikTok download error: {error_msg}") from e
                 
         except Exception as e:
-            last_error = e
             logger.error(f"Unexpected error downloading TikTok (attempt {attempt + 1}/{max_retries}): {e}")
             if attempt == max_retries - 1:
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
                 raise
 
 
 async def send_video_content(event: Message, file_path: str, metadata: dict, bot_username: str = ""):
-    """Send video file to Telegram with proper attributes."""
+    """Send video file to Telegram with proper attributes and return the sent message."""
     caption = f"@{bot_username}" if bot_username else ""
     
     video_attr = DocumentAttributeVideo(
         duration=metadata.get('duration', 0),
-        w=metadata.get('width', DEFAULT_VIDEO_WIDTH),
-        h=metadata.get('height', DEFAULT_VIDEO_HEIGHT),
+        w=metadata.get('width', config.DEFAULT_VIDEO_WIDTH),
+        h=metadata.get('height', config.DEFAULT_VIDEO_HEIGHT),
         supports_streaming=True
     )
     
-    await event.respond(
+    return await event.respond(
         caption,
         file=file_path,
         supports_streaming=True,
@@ -366,7 +777,7 @@ async def send_video_content(event: Message, file_path: str, metadata: dict, bot
 
 
 async def send_audio_content(event: Message, file_path: str, metadata: dict, bot_username: str = ""):
-    """Send audio file to Telegram with proper attributes."""
+    """Send audio file to Telegram with proper attributes and return the sent message."""
     caption = f"@{bot_username}" if bot_username else ""
     
     audio_attr = DocumentAttributeAudio(
@@ -375,7 +786,7 @@ async def send_audio_content(event: Message, file_path: str, metadata: dict, bot
         performer=metadata.get('artist', 'Unknown Artist')
     )
     
-    await event.respond(
+    return await event.respond(
         caption,
         file=file_path,
         attributes=[audio_attr]
@@ -383,14 +794,49 @@ async def send_audio_content(event: Message, file_path: str, metadata: dict, bot
 
 
 async def send_image_content(event: Message, file_path: str, bot_username: str = ""):
-    """Send image file to Telegram."""
+    """Send image file to Telegram and return the sent message."""
     caption = f"@{bot_username}" if bot_username else ""
     
-    await event.respond(
+    return await event.respond(
         caption,
         file=file_path
     )
 
+async def send_twitter_content(event: Message, file_path: str, metadata: dict, bot_username: str = ""):
+    """Send Twitter/X content as a photo or a video, whichever was downloaded."""
+    if metadata.get('content_type') == 'photo':
+        return await send_image_content(event, file_path, bot_username)
+    return await send_video_content(event, file_path, metadata, bot_username)
+
+
+async def _run_process(args: List[str], timeout: float) -> Tuple[int, str, str]:
+    """Run an external command without occupying an executor thread.
+    
+    Args:
+        args: Command and its arguments
+        timeout: Seconds to wait before killing the process
+        
+    Returns:
+        Tuple of (return code, stdout, stderr)
+        
+    Raises:
+        FileNotFoundError: If the command is not installed
+        asyncio.TimeoutError: If the process did not finish in time
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return proc.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+
 async def _download_twitter_photos_with_gallery_dl(url: str, temp_dir: str) -> Tuple[str, dict]:
     """Download Twitter content (photos or videos) using gallery-dl.
     
@@ -404,24 +850,17 @@ async def _download_twitter_photos_with_gallery_dl(url: str, temp_dir: str) -> T
     Raises:
         Exception: If download fails or no media found
     """
-    import subprocess
-    
     try:
         # Run gallery-dl to download content (supports both photos and videos)
         # Use --no-mtime to avoid issues, and flat directory structure
-        result = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: subprocess.run(
-                ['gallery-dl', '-d', temp_dir, '-o', 'directory=[]', '-o', 'filename={tweet_id}_{num}.{extension}', url],
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
+        returncode, stdout, stderr = await _run_process(
+            ['gallery-dl', '-d', temp_dir, '-o', 'directory=[]', '-o', 'filename={tweet_id}_{num}.{extension}', url],
+            timeout=120
         )
         
-        logger.info(f"gallery-dl stdout: {result.stdout}")
-        logger.info(f"gallery-dl stderr: {result.stderr}")
-        logger.info(f"gallery-dl return code: {result.returncode}")
+        logger.info(f"gallery-dl stdout: {stdout}")
+        logger.info(f"gallery-dl stderr: {stderr}")
+        logger.info(f"gallery-dl return code: {returncode}")
         
         # Find downloaded files recursively (gallery-dl may create subdirectories)
         all_files = []
@@ -431,9 +870,9 @@ async def _download_twitter_photos_with_gallery_dl(url: str, temp_dir: str) -> T
         
         logger.info(f"Files found in temp_dir: {all_files}")
         
-        if result.returncode != 0 and not all_files:
-            logger.error(f"gallery-dl failed: {result.stderr}")
-            raise Exception(f"gallery-dl error: {result.stderr}")
+        if returncode != 0 and not all_files:
+            logger.error(f"gallery-dl failed: {stderr}")
+            raise Exception(f"gallery-dl error: {stderr}")
         
         # Video extensions
         video_files = [f for f in all_files if f.endswith(('.mp4', '.webm', '.mov', '.avi', '.mkv'))]
@@ -447,18 +886,13 @@ async def _download_twitter_photos_with_gallery_dl(url: str, temp_dir: str) -> T
             # Try to get video duration using ffprobe if available
             duration = 0
             try:
-                probe_result = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    lambda: subprocess.run(
-                        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', 
-                         '-of', 'default=noprint_wrappers=1:nokey=1', file_path],
-                        capture_output=True,
-                        text=True,
-                        timeout=10
-                    )
+                probe_code, probe_out, _ = await _run_process(
+                    ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', 
+                     '-of', 'default=noprint_wrappers=1:nokey=1', file_path],
+                    timeout=10
                 )
-                if probe_result.returncode == 0 and probe_result.stdout.strip():
-                    duration = int(float(probe_result.stdout.strip()))
+                if probe_code == 0 and probe_out.strip():
+                    duration = int(float(probe_out.strip()))
             except Exception:
                 pass
             
@@ -484,17 +918,18 @@ async def _download_twitter_photos_with_gallery_dl(url: str, temp_dir: str) -> T
         
     except FileNotFoundError:
         raise Exception("gallery-dl not installed")
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         raise Exception("gallery-dl timeout")
 
 
-async def download_twitter_video(url: str, max_retries: int = None) -> Tuple[str, dict]:
+async def download_twitter_video(url: str, temp_dir: str, max_retries: int = None) -> Tuple[str, dict]:
     """Download a Twitter/X video or photo and return the path and metadata.
     
     Strategy: Try gallery-dl first (works best for photos), then fall back to yt-dlp for videos.
     
     Args:
         url: Twitter/X video or photo URL
+        temp_dir: Caller-owned directory to download into
         max_retries: Maximum number of retry attempts (uses config default if None)
         
     Returns:
@@ -504,9 +939,7 @@ async def download_twitter_video(url: str, max_retries: int = None) -> Tuple[str
         Exception: If download fails after all retries
     """
     if max_retries is None:
-        max_retries = TWITTER_MAX_RETRIES
-    
-    temp_dir = tempfile.mkdtemp()
+        max_retries = config.TWITTER_MAX_RETRIES
     
     # First, try gallery-dl (works best for photos and also supports videos)
     try:
@@ -517,26 +950,18 @@ async def download_twitter_video(url: str, max_retries: int = None) -> Tuple[str
     except Exception as gallery_error:
         logger.info(f"gallery-dl did not find content or failed: {gallery_error}, trying yt-dlp for video")
         # Clean temp_dir for yt-dlp
-        for f in os.listdir(temp_dir):
-            try:
-                os.remove(os.path.join(temp_dir, f))
-            except Exception:
-                pass
+        _wipe_dir(temp_dir)
     
-    # Fall back to yt-dlp for videos
-    last_error = None
+    # Fall back to yt-dlp for videos; retries stop early rather than sleep past the deadline
+    deadline = time.monotonic() + config.TWITTER_RETRY_DEADLINE
     
     for attempt in range(max_retries):
         try:
-            ydl_opts = {
-                **YDLP_BASE_OPTS,
-                'format': 'best',
-                'outtmpl': f'{temp_dir}/%(id)s.%(ext)s',
-            }
+            ydl_opts = _direct_video_opts().copy()
+            ydl_opts['outtmpl'] = os.path.join(temp_dir, _OUTPUT_NAME)
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = await asyncio.get_event_loop().run_in_executor(None, ydl.extract_info, url, False)
-                await asyncio.get_event_loop().run_in_executor(None, ydl.download, [url])
+            # Extract and download in one pass
+            info = await _run_in_ydl_thread(_extract_and_download, ydl_opts, url)
             
             # Try to find video/media files first, then fall back to images
             try:
@@ -556,27 +981,21 @@ async def download_twitter_video(url: str, max_retries: int = None) -> Tuple[str
             
             return file_path, metadata
             
-        except yt_dlp.utils.DownloadError as e:
+        except _ytdlp().utils.DownloadError as e:
             error_msg = str(e)
-            last_error = e
             
-            if attempt < max_retries - 1:
-                wait_time = TWITTER_RETRY_BACKOFF ** attempt
+            wait_time = _retry_delay(config.TWITTER_RETRY_BACKOFF, attempt)
+            if attempt < max_retries - 1 and time.monotonic() + wait_time < deadline:
                 logger.warning(
                     f"Twitter extraction failed (attempt {attempt + 1}/{max_retries}). "
-                    f"Retrying in {wait_time}s... Error: {error_msg}"
+                    f"Retrying in {wait_time:.1f}s... Error: {error_msg}"
                 )
                 await asyncio.sleep(wait_time)
                 continue
             else:
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-                raise Exception(TWITTER_ERROR_MESSAGE)
+                raise Exception(config.TWITTER_ERROR_MESSAGE) from e
         
         except Exception as e:
-            last_error = e
             logger.error(f"Unexpected error downloading Twitter (attempt {attempt + 1}/{max_retries}): {e}")
             if attempt == max_retries - 1:
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
                 raise
\ No newline at end of file
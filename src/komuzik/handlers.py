@@ -1,15 +1,21 @@
 """Event handlers for Telegram bot commands and callbacks."""
-import re
+import asyncio
+import base64
+import hashlib
+import itertools
 import logging
-import shutil
-import os
-import uuid
-from typing import Callable, Dict
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
 from telethon import events, Button
+from telethon.errors import FloodWaitError
 from telethon.tl.custom import Message
 from telethon.tl.types import TypeUpdate
 
-from .config import YOUTUBE_REGEX, TIKTOK_REGEX, TWITTER_REGEX, MSG_START, MSG_HELP
+from . import config
+from .config import classify_url
 from .downloaders import (
     get_available_formats,
     search_youtube,
@@ -17,170 +23,451 @@ from .downloaders import (
     download_youtube_audio,
     download_tiktok_video,
     download_twitter_video,
+    clear_cache,
+    temp_directory,
     send_video_content,
     send_audio_content,
-    send_image_content,
+    send_twitter_content,
 )
 from .repository import StatsRepository
 from .download_limiter import DownloadLimiter
 
 logger = logging.getLogger(__name__)
 
-# States for /report command state machine
-REPORT_STATES = {}
+
+def _command_re(name: str) -> re.Pattern:
+    """Compile the pattern of a bot command, also matching /name@BotName."""
+    return re.compile(rf'^/{name}(?:\s|$|@)')
+
+
+# Bot commands, compiled once
+_START_RE = _command_re('start')
+_HELP_RE = _command_re('help')
+_STATS_RE = _command_re('stats')
+_POST_RE = _command_re('post')
+_REPORT_RE = _command_re('report')
+_CLEARCACHE_RE = _command_re('clearcache')
+_CANCEL_RE = re.compile(r'^/cancel(?:@\w+)?\s*$')
+# /search command; group 1 is the query
+_SEARCH_RE = re.compile(r'^/search(?:@\w+)?(?:\s+(.+))?')
+
+# Users whose next message is a /report text
+REPORT_STATES: set[int] = set()
+
+# Callback data carries a short URL token instead of the URL itself
+# (Telegram limits callback data to 64 bytes); this many recent tokens are kept
+URL_TOKEN_CACHE_SIZE = 1024
+
+# Sending a file is retried this many times after a FLOOD_WAIT...
+FLOOD_WAIT_RETRIES = 3
+# ...unless Telegram asks to wait longer than this many seconds
+FLOOD_WAIT_MAX_SECONDS = 60
+
+# /post broadcast: messages in flight at once and sends started per second
+# (Telegram allows bots about 30 messages per second)
+BROADCAST_CONCURRENCY = 25
+BROADCAST_RATE = 25
+
+# Quality label suffixes by minimum video height, highest first
+_HEIGHT_TIERS = ((2160, ' 4K'), (1440, ' 2K'), (720, ' HD'), (0, ''))
+
+# Period switch buttons shown with /stats and every statistics view
+_STATS_PERIOD_BUTTONS = [
+    [
+        Button.inline("📊 За день", data="stats_day"),
+        Button.inline("📅 За месяц", data="stats_month")
+    ],
+    [
+        Button.inline("📈 За все время", data="stats_all")
+    ]
+]
+
+# Audio quality buttons as rows of (label, preset name)
+_AUDIO_QUALITY_ROWS = (
+    (("Высокое качество", "high"), ("Среднее качество", "medium")),
+    (("Низкое качество", "low"),),
+)
+
+# Stats events are written in batches of up to this many...
+STATS_BATCH_SIZE = 100
+# ...collected for this many seconds after the first one
+STATS_BATCH_DELAY = 0.5
+
+
+# Process-local download IDs for DownloadLimiter; they never leave the process
+_next_download_id = itertools.count().__next__
+
+
+class _DownloadSource(NamedTuple):
+    """How content of one kind is downloaded, sent and tracked."""
+    content_type: str
+    download_func: Callable
+    send_func: Callable
+    event_type: str
+    platform: str
+    action: str
+    # Format recorded in statistics instead of the requested quality
+    tracked_format: Optional[str] = None
+
+
+_SOURCES: Dict[str, _DownloadSource] = {
+    'youtube_video': _DownloadSource(
+        "видео", download_youtube_video, send_video_content, 'video_download', 'youtube', 'video'
+    ),
+    'youtube_audio': _DownloadSource(
+        "аудио", download_youtube_audio, send_audio_content, 'audio_download', 'youtube', 'audio'
+    ),
+    'youtube_shorts': _DownloadSource(
+        "YouTube Short", download_youtube_video, send_video_content, 'video_download', 'youtube_shorts', 'video',
+        tracked_format='auto'
+    ),
+    'tiktok': _DownloadSource(
+        "TikTok видео", download_tiktok_video, send_video_content, 'tiktok_download', 'tiktok', 'video'
+    ),
+    # Twitter/X downloads have always been counted as TikTok downloads in statistics
+    'twitter': _DownloadSource(
+        "контента с Twitter", download_twitter_video, send_twitter_content, 'tiktok_download', 'tiktok', 'video'
+    ),
+}
+
+
+def _is_not_command(event: Message) -> bool:
+    """Event filter letting through messages that are not bot commands."""
+    return not (event.message.text or '').startswith('/')
 
 
 class BotHandlers:
     """Handles all bot commands and callbacks."""
     
+    __slots__ = (
+        'client',
+        'bot_username',
+        'stats',
+        'download_limiter',
+        '_download_semaphore',
+        '_stats_queue',
+        '_stats_executor',
+        '_routes',
+        '_inflight',
+        '_background_tasks',
+        '_url_tokens',
+    )
+    
     def __init__(self, client, stats_repo: StatsRepository, bot_username: str = ""):
         self.client = client
         self.bot_username = bot_username
         self.stats = stats_repo
         self.download_limiter = DownloadLimiter()
+        # Bot-wide cap on downloads in progress, on top of the per-user limit
+        self._download_semaphore = asyncio.Semaphore(config.MAX_DOWNLOADS_TOTAL)
+        # Tracking events waiting to be written by the stats writer task
+        self._stats_queue: asyncio.Queue = asyncio.Queue()
+        # Batched stats writes run on their own thread; other database calls
+        # use asyncio.to_thread so reads never queue behind a write batch
+        self._stats_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stats-writer')
+        # Callback routes keyed by the data prefix before the first '_'
+        self._routes: Dict[str, Callable] = {
+            'select': self._handle_select_callback,
+            'content': self._handle_content_callback,
+            'quality': self._handle_quality_callback,
+            'audio': self._handle_audio_callback,
+            'stats': self._handle_stats_callback,
+        }
+        # Downloads in progress by (event type, URL, quality), resolved with the sent message
+        self._inflight: Dict[Tuple[_DownloadSource, str, Optional[str]], asyncio.Future] = {}
+        # Fire-and-forget tasks, referenced until they finish
+        self._background_tasks: set = set()
+        # URL tokens used in callback data, least recently used first
+        self._url_tokens: "OrderedDict[str, str]" = OrderedDict()
         self._register_handlers()
     
     def _register_handlers(self):
         """Register all event handlers."""
-        self.client.on(events.NewMessage(pattern='/start'))(self.start_handler)
-        self.client.on(events.NewMessage(pattern='/help'))(self.help_handler)
-        self.client.on(events.NewMessage(pattern='/stats'))(self.stats_handler)
-        self.client.on(events.NewMessage(pattern='/post'))(self.post_handler)
-        self.client.on(events.NewMessage(pattern='/report'))(self.report_handler)
-        self.client.on(events.NewMessage(pattern=r'^/search(?:\s+(.+))?'))(self.search_handler)
-        self.client.on(events.NewMessage())(self.message_handler)
+        self.client.on(events.NewMessage(pattern=_START_RE))(self.start_handler)
+        self.client.on(events.NewMessage(pattern=_HELP_RE))(self.help_handler)
+        self.client.on(events.NewMessage(pattern=_STATS_RE))(self.stats_handler)
+        self.client.on(events.NewMessage(pattern=_POST_RE))(self.post_handler)
+        self.client.on(events.NewMessage(pattern=_REPORT_RE))(self.report_handler)
+        self.client.on(events.NewMessage(pattern=_CLEARCACHE_RE))(self.clearcache_handler)
+        self.client.on(events.NewMessage(pattern=_SEARCH_RE))(self.search_handler)
+        self.client.on(events.NewMessage(pattern=_CANCEL_RE))(self.cancel_handler)
+        # Commands are filtered out before a handler coroutine is even created
+        self.client.on(events.NewMessage(func=_is_not_command))(self.message_handler)
         self.client.on(events.CallbackQuery())(self.callback_handler)
     
-    def _track_user(self, event: Message):
+    def _track_user(self, user_id: int, username: Optional[str]):
         """Track user activity."""
-        user_id = event.sender_id
-        username = event.sender.username if event.sender else None
-        self.stats.track_user(user_id, username)
+        self._stats_queue.put_nowait(('user', user_id, username))
     
-    def _get_user_info(self, event: Message) -> tuple[int, str | None]:
-        """Extract user ID and username from event."""
-        user_id = event.sender_id
-        username = event.sender.username if event.sender else None
-        return user_id, username
+    def _track_event(
+        self,
+        event_type: str,
+        user_id: int,
+        username: Optional[str] = None,
+        video_format: Optional[str] = None,
+        platform: Optional[str] = None,
+        success: bool = True,
+        error_message: Optional[str] = None
+    ):
+        """Queue a statistics event for the stats writer."""
+        self._stats_queue.put_nowait(
+            (event_type, user_id, username, video_format, platform, success, error_message)
+        )
     
-    async def _check_download_limit(self, event: Message, user_id: int, download_id: str) -> bool:
-        """Check if user can start a new download.
+    def start_stats_writer(self) -> asyncio.Task:
+        """Start the background task that writes queued stats events.
         
         Returns:
-            True if download can proceed, False if limit reached
+            The running task; cancel it on shutdown and call flush_stats()
         """
-        if not self.download_limiter.start_download(user_id, download_id):
-            active_count = self.download_limiter.get_active_count(user_id)
-            await event.respond(
-                f"⚠️ У вас уже есть активная загрузка ({active_count}/{self.download_limiter.MAX_DOWNLOADS_PER_USER}). "
-                f"Пожалуйста, дождитесь завершения текущей загрузки."
-            )
+        return asyncio.create_task(self._stats_writer_loop())
+    
+    async def _stats_writer_loop(self):
+        """Write queued stats events in batches, one transaction per batch."""
+        while True:
+            batch = [await self._stats_queue.get()]
+            try:
+                # Let events that follow the first one accumulate, then take them all
+                await asyncio.sleep(STATS_BATCH_DELAY)
+                while len(batch) < STATS_BATCH_SIZE and not self._stats_queue.empty():
+                    batch.append(self._stats_queue.get_nowait())
+            finally:
+                # Events already taken off the queue are written even on cancellation
+                await asyncio.get_running_loop().run_in_executor(
+                    self._stats_executor, self.stats.track_batch, batch
+                )
+    
+    def flush_stats(self):
+        """Write all stats events still in the queue.
+        
+        Call after the stats writer task has finished, before closing the database.
+        """
+        batch = []
+        while not self._stats_queue.empty():
+            batch.append(self._stats_queue.get_nowait())
+        if batch:
+            self.stats.track_batch(batch)
+    
+    def shutdown_stats_writer(self):
+        """Stop the stats writer thread once it has finished any write in progress.
+        
+        Call after flush_stats(), before closing the database.
+        """
+        self._stats_executor.shutdown(wait=True)
+    
+    async def _get_user_info(self, event: Message) -> tuple[int, str | None]:
+        """Extract user ID and username from event.
+        
+        get_sender() resolves the sender from Telethon's entity cache when
+        possible and keeps it on the event, so repeated calls are free.
+        """
+        sender = await event.get_sender()
+        return event.sender_id, getattr(sender, 'username', None)
+    
+    def _url_token(self, url: str) -> str:
+        """Get the callback data token for a URL.
+        
+        The token is derived from the URL, so menus built repeatedly for the
+        same video reuse one entry.
+        """
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=6).digest()
+        token = base64.urlsafe_b64encode(digest).decode('ascii')
+        self._url_tokens[token] = url
+        self._url_tokens.move_to_end(token)
+        if len(self._url_tokens) > URL_TOKEN_CACHE_SIZE:
+            self._url_tokens.popitem(last=False)
+        return token
+    
+    async def _resolve_url_token(self, event, token: str) -> Optional[str]:
+        """Get the URL for a callback data token, telling the user if it expired."""
+        url = self._url_tokens.get(token)
+        if url is None:
+            await event.answer("Ссылка устарела, отправьте её снова.", alert=True)
+        return url
+    
+    def _delete_in_background(self, message: Message):
+        """Delete a message without waiting for Telegram to confirm.
+        
+        The chat action and the temp directory are released while the
+        deletion is in flight instead of after it.
+        """
+        task = asyncio.create_task(message.delete())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+    
+    def _background_task_done(self, task: asyncio.Task):
+        """Forget a finished background task and log its failure, if any."""
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background task failed: {task.exception()}")
+    
+    async def _send_with_flood_wait(self, send_func: Callable, *args):
+        """Call a send function, waiting out Telegram FLOOD_WAIT errors.
+        
+        Args:
+            send_func: Coroutine function that sends content
+            *args: Arguments for send_func
+            
+        Raises:
+            FloodWaitError: If retries are exhausted or the wait is too long
+        """
+        for attempt in range(FLOOD_WAIT_RETRIES + 1):
+            try:
+                return await send_func(*args)
+            except FloodWaitError as e:
+                if attempt == FLOOD_WAIT_RETRIES or e.seconds > FLOOD_WAIT_MAX_SECONDS:
+                    raise
+                # Telegram tells how long to wait; later attempts add a growing margin
+                delay = e.seconds + 2 ** attempt
+                logger.warning(f"FLOOD_WAIT on send, retrying in {delay}s")
+                await asyncio.sleep(delay)
+    
+    @asynccontextmanager
+    async def _inflight_download(self, key: Tuple[_DownloadSource, str, Optional[str]]):
+        """Register a download so identical requests can reuse its upload.
+        
+        Yields a future for the sent message. If it is not set by the end
+        of the block, waiters get None and download on their own.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            yield future
+        finally:
+            if not future.done():
+                future.set_result(None)
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+    
+    async def _resend_inflight(self, event: Message, key: Tuple[_DownloadSource, str, Optional[str]]) -> bool:
+        """Wait for an identical download in progress and resend its upload.
+        
+        The file is sent by reference to the already uploaded media, so it
+        is neither downloaded nor uploaded again.
+        
+        Returns:
+            True if the content was sent, False if there was nothing to reuse
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            return False
+        
+        logger.info(f"Waiting for identical download in progress: {key}")
+        sent = await asyncio.shield(future)
+        if sent is None or sent.media is None:
             return False
+        
+        await event.respond(sent.message, file=sent.media)
         return True
     
+    async def _notify_download_limit(self, event: Message, user_id: int):
+        """Tell the user that the concurrent download limit is reached."""
+        active_count = self.download_limiter.get_active_count(user_id)
+        await event.respond(
+            f"⚠️ У вас уже есть активная загрузка ({active_count}/{self.download_limiter.MAX_DOWNLOADS_PER_USER}). "
+            f"Пожалуйста, дождитесь завершения текущей загрузки."
+        )
+    
     async def _download_and_send_content(
-        self, 
-        event: Message, 
-        url: str, 
-        quality: str,
-        content_type: str,
-        download_func: Callable,
-        send_func: Callable,
-        track_func: Callable,
-        action: str
+        self,
+        event: Message,
+        url: str,
+        source: _DownloadSource,
+        quality: Optional[str] = None
     ):
-        """Generic function to download and send content (video/audio).
+        """Generic function to download and send content of any source.
         
         Args:
             event: Telegram event
             url: Content URL
-            quality: Quality setting
-            content_type: 'video' or 'audio' for logging
-            download_func: Function to download content
-            send_func: Function to send content
-            track_func: Function to track download stats
-            action: Telegram action type ('video' or 'audio')
+            source: How to download, send and track the content
+            quality: Quality setting, or None for sources without one
         """
-        user_id, username = self._get_user_info(event)
-        download_id = str(uuid.uuid4())
-        
-        # Check download limit
-        if not await self._check_download_limit(event, user_id, download_id):
-            return
+        user_id, username = await self._get_user_info(event)
+        download_id = _next_download_id()
+        content_type = source.content_type
+        video_format = source.tracked_format or quality
         
+        # Someone is already downloading the same thing: reuse their upload
+        key = (source, url, quality)
         try:
-            async with event.client.action(event.chat_id, action):
+            if await self._resend_inflight(event, key):
+                self._track_event(source.event_type, user_id, username, video_format, source.platform, success=True)
+                return
+        except Exception as e:
+            logger.warning(f"Failed to reuse in-flight download, downloading again: {e}")
+        
+        async with self.download_limiter.slot(user_id, download_id) as acquired:
+            if not acquired:
+                await self._notify_download_limit(event, user_id)
+                return
+            
+            # Registered only once the download is admitted, so identical
+            # requests never wait on one the limiter rejected
+            async with self._inflight_download(key) as sent_future, self._download_semaphore:
                 try:
                     processing_msg = await event.respond(f"Загрузка {content_type}... Пожалуйста, подождите.")
                     logger.info(f"Downloading {content_type}: {url} with quality: {quality}")
                     
-                    file_path, metadata = await download_func(url, quality)
-                    logger.info(f"{content_type.capitalize()} downloaded successfully: {file_path}")
-                    
-                    await send_func(event, file_path, metadata, self.bot_username)
-                    await processing_msg.delete()
+                    # Entered inside the try, so a temp directory that cannot be
+                    # created is reported to the user like any other failure
+                    async with event.client.action(event.chat_id, source.action), temp_directory() as temp_dir:
+                        if quality is None:
+                            file_path, metadata = await source.download_func(url, temp_dir)
+                        else:
+                            file_path, metadata = await source.download_func(url, temp_dir, quality)
+                        logger.info(f"Downloaded {content_type} successfully: {file_path}")
+                        
+                        sent = await self._send_with_flood_wait(source.send_func, event, file_path, metadata, self.bot_username)
+                    sent_future.set_result(sent)
+                    self._delete_in_background(processing_msg)
                     
                     # Track successful download
-                    track_func(user_id, quality, username, success=True)
-                    
-                    # Cleanup
-                    if os.path.exists(os.path.dirname(file_path)):
-                        shutil.rmtree(os.path.dirname(file_path))
+                    self._track_event(source.event_type, user_id, username, video_format, source.platform, success=True)
                         
                 except Exception as e:
                     logger.error(f"Error sending {content_type}: {e}")
                     # Track failed download
-                    track_func(user_id, quality, username, success=False, error_message=str(e))
+                    self._track_event(
+                        source.event_type, user_id, username, video_format, source.platform,
+                        success=False, error_message=str(e)
+                    )
                     await event.respond(f"Произошла ошибка при обработке {content_type}: {str(e)}")
-        finally:
-            # Always release the download slot
-            self.download_limiter.finish_download(user_id, download_id)
     
     async def start_handler(self, event: Message):
         """Handle /start command."""
-        self._track_user(event)
-        await event.respond(MSG_START)
+        self._track_user(*await self._get_user_info(event))
+        await event.respond(config.MSG_START)
     
     async def help_handler(self, event: Message):
         """Handle /help command."""
-        self._track_user(event)
-        await event.respond(MSG_HELP)
+        self._track_user(*await self._get_user_info(event))
+        await event.respond(config.MSG_HELP)
     
     async def stats_handler(self, event: Message):
         """Handle /stats command."""
-        self._track_user(event)
-        
-        buttons = [
-            [
-                Button.inline("📊 За день", data="stats_day"),
-                Button.inline("📅 За месяц", data="stats_month")
-            ],
-            [
-                Button.inline("📈 За все время", data="stats_all")
-            ]
-        ]
+        self._track_user(*await self._get_user_info(event))
         
         await event.respond(
             "📊 Статистика бота Komuzik\n\n"
             "Выберите период для просмотра статистики:",
-            buttons=buttons
+            buttons=_STATS_PERIOD_BUTTONS
         )
     
     async def search_handler(self, event: Message):
         """Handle /search command."""
-        self._track_user(event)
+        user_id, username = await self._get_user_info(event)
+        self._track_user(user_id, username)
         
-        match = re.match(r'^/search(?:\s+(.+))?', event.message.text)
-        query = match.group(1) if match else None
+        # Telethon already matched _SEARCH_RE when dispatching, reuse its match
+        query = event.pattern_match.group(1)
         
         if not query:
             await event.respond("Пожалуйста, укажите поисковый запрос.\nПример: /search название песни")
             return
         
         # Track search
-        user_id = event.sender_id
-        username = event.sender.username if event.sender else None
-        self.stats.track_search(user_id, username)
+        self._track_event('search', user_id, username)
         
         searching_msg = await event.respond(f"🔍 Поиск: {query}...")
         results = await search_youtube(query, max_results=5)
@@ -195,31 +482,24 @@ class BotHandlers:
             duration_min = duration // 60
             duration_sec = duration % 60
             button_text = f"{i}. {result['title'][:50]}{'...' if len(result['title']) > 50 else ''} ({duration_min}:{duration_sec:02d})"
-            buttons.append([Button.inline(button_text, data=f"select_{result['url']}")])
+            buttons.append([Button.inline(button_text, data=f"select_{self._url_token(result['url'])}")])
         
         await searching_msg.edit("Выберите видео из результатов поиска:", buttons=buttons)
     
     async def message_handler(self, event: Message):
         """Handle incoming messages with YouTube, TikTok and Twitter links."""
-        if event.message.text is None:
+        text = event.message.text
+        if text is None:
             return
         
-        user_id, username = self._get_user_info(event)
+        user_id, username = await self._get_user_info(event)
         
         # Check if user is in report state
-        if user_id in REPORT_STATES and REPORT_STATES[user_id]:
-            report_text = event.message.text
-            
-            # Ignore if user sends another command while in report state
-            if report_text.startswith('/'):
-                # Handle /cancel command
-                if report_text.strip() == '/cancel':
-                    del REPORT_STATES[user_id]
-                    await event.respond("❌ Отправка отчета отменена.")
-                return
+        if user_id in REPORT_STATES:
+            report_text = text
             
             # Save report to database
-            self.stats.save_user_report(user_id, username, report_text)
+            await asyncio.to_thread(self.stats.save_user_report, user_id, username, report_text)
             
             # Send report to admins
             report_msg = f"📋 **Новый отчет**\n\nОт: @{username or user_id}\nID: {user_id}\n\nТекст:\n{report_text}"
@@ -234,131 +514,52 @@ class BotHandlers:
             await event.respond("✅ Спасибо! Ваш отчет отправлен администраторам.")
             
             # Clear state
-            del REPORT_STATES[user_id]
+            REPORT_STATES.discard(user_id)
             return
         
-        if event.message.text.startswith('/'):
-            return
+        self._track_user(user_id, username)
         
-        self._track_user(event)
-        
-        # Check for Twitter/X
-        twitter_match = TWITTER_REGEX.search(event.message.text)
-        if twitter_match:
-            await self._handle_twitter(event, twitter_match.group(0))
-            return
+        platform, url = classify_url(text)
         
-        # Check for TikTok
-        tiktok_match = TIKTOK_REGEX.search(event.message.text)
-        if tiktok_match:
-            await self._handle_tiktok(event, tiktok_match.group(0))
-            return
-        
-        # Check for YouTube (including Shorts)
-        youtube_match = YOUTUBE_REGEX.search(event.message.text)
-        if not youtube_match:
-            await event.respond("Пожалуйста, отправьте корректную ссылку на видео YouTube, YouTube Shorts, TikTok или Twitter/X.")
-            return
-        
-        # Check if it's a YouTube Shorts
-        if '/shorts/' in event.message.text:
-            await self._handle_youtube_shorts(event, youtube_match.group(0))
+        if platform == 'twitter':
+            await self._download_and_send_content(event, url, _SOURCES['twitter'])
+        elif platform == 'tiktok':
+            await self._download_and_send_content(event, url, _SOURCES['tiktok'])
+        elif platform == 'youtube':
+            # Check if it's a YouTube Shorts
+            if '/shorts/' in url:
+                await self._download_and_send_content(event, url, _SOURCES['youtube_shorts'], quality='best')
+            else:
+                await self._show_content_type_selection(event, url)
         else:
-            await self._show_content_type_selection(event, youtube_match.group(0))
-    
-    async def _handle_tiktok(self, event: Message, url: str):
-        """Handle TikTok video download."""
-        user_id, username = self._get_user_info(event)
-        download_id = str(uuid.uuid4())
-        
-        # Check download limit
-        if not await self._check_download_limit(event, user_id, download_id):
-            return
-        
-        try:
-            async with event.client.action(event.chat_id, 'video'):
-                try:
-                    processing_msg = await event.respond("Загрузка TikTok видео... Пожалуйста, подождите.")
-                    logger.info(f"Downloading TikTok video: {url}")
-                    
-                    file_path, metadata = await download_tiktok_video(url)
-                    logger.info(f"TikTok video downloaded successfully: {file_path}")
-                    
-                    await send_video_content(event, file_path, metadata, self.bot_username)
-                    await processing_msg.delete()
-                    
-                    # Track successful TikTok download
-                    self.stats.track_tiktok_download(user_id, username, success=True)
-                    
-                    # Cleanup
-                    if os.path.exists(os.path.dirname(file_path)):
-                        shutil.rmtree(os.path.dirname(file_path))
-                        
-                except Exception as e:
-                    logger.error(f"Error sending TikTok video: {e}")
-                    # Track failed TikTok download
-                    self.stats.track_tiktok_download(user_id, username, success=False, error_message=str(e))
-                    await event.respond(f"Произошла ошибка при обработке TikTok видео: {str(e)}")
-        finally:
-            # Always release the download slot
-            self.download_limiter.finish_download(user_id, download_id)
+            await event.respond("Пожалуйста, отправьте корректную ссылку на видео YouTube, YouTube Shorts, TikTok или Twitter/X.")
     
     async def _show_content_type_selection(self, event: Message, url: str):
         """Show content type selection buttons for YouTube."""
+        token = self._url_token(url)
         buttons = [
             [
-                Button.inline("🎬 Видео", data=f"content_video_{url}"),
-                Button.inline("🎵 Аудио", data=f"content_audio_{url}")
+                Button.inline("🎬 Видео", data=f"content_video_{token}"),
+                Button.inline("🎵 Аудио", data=f"content_audio_{token}")
             ]
         ]
         await event.respond("Выберите тип контента для загрузки:", buttons=buttons)
     
-    async def _handle_youtube_shorts(self, event: Message, url: str):
-        """Handle YouTube Shorts download."""
-        user_id, username = self._get_user_info(event)
-        download_id = str(uuid.uuid4())
-        
-        if not await self._check_download_limit(event, user_id, download_id):
-            return
-        
-        try:
-            async with event.client.action(event.chat_id, 'video'):
-                try:
-                    processing_msg = await event.respond("Загрузка YouTube Short... Пожалуйста, подождите.")
-                    logger.info(f"Downloading YouTube Short: {url}")
-                    
-                    file_path, metadata = await download_youtube_video(url, quality='best')
-                    logger.info(f"YouTube Short downloaded successfully: {file_path}")
-                    
-                    await send_video_content(event, file_path, metadata, self.bot_username)
-                    await processing_msg.delete()
-                    
-                    self.stats.track_video_download(user_id, 'auto', 'youtube_shorts', username, success=True)
-                    
-                    if os.path.exists(os.path.dirname(file_path)):
-                        shutil.rmtree(os.path.dirname(file_path))
-                        
-                except Exception as e:
-                    logger.error(f"Error sending YouTube Short: {e}")
-                    self.stats.track_video_download(user_id, 'auto', 'youtube_shorts', username, success=False, error_message=str(e))
-                    await event.respond(f"Произошла ошибка при обработке YouTube Short: {str(e)}")
-        finally:
-            self.download_limiter.finish_download(user_id, download_id)
-
-    
-    
-    async def _handle_select_callback(self, event, data: str):
+    async def _handle_select_callback(self, event, token: str):
         """Handle video selection from search results."""
-        url = data[7:]  # Remove 'select_' prefix
+        url = await self._resolve_url_token(event, token)
+        if url is None:
+            return
         await self._show_content_type_selection(event, url)
     
     async def _handle_content_callback(self, event, data: str):
         """Handle content type selection (video/audio)."""
-        parts = data.split('_', 2)
-        if len(parts) != 3:
+        content_type, sep, token = data.partition('_')
+        if not sep:
+            return
+        url = await self._resolve_url_token(event, token)
+        if url is None:
             return
-        
-        content_type, url = parts[1], parts[2]
         
         if content_type == 'video':
             await self._show_video_quality_selection(event, url)
@@ -373,31 +574,16 @@ class BotHandlers:
         available_heights = await get_available_formats(url)
         logger.info(f"Available heights: {available_heights}")
         
-        buttons = []
-        row = []
-        
-        for height in available_heights:
-            # Create label based on height
-            if height >= 2160:
-                label = f"{height}p 4K"
-            elif height >= 1440:
-                label = f"{height}p 2K"
-            elif height >= 720:
-                label = f"{height}p HD"
-            else:
-                label = f"{height}p"
-            
-            quality_id = f"{height}p"
-            row.append(Button.inline(label, data=f"quality_{quality_id}_{url}"))
-            
-            # Two buttons per row
-            if len(row) == 2:
-                buttons.append(row)
-                row = []
-        
-        # Add remaining buttons
-        if row:
-            buttons.append(row)
+        token = self._url_token(url)
+        quality_buttons = [
+            Button.inline(
+                f"{height}p{next(suffix for tier, suffix in _HEIGHT_TIERS if height >= tier)}",
+                data=f"quality_{height}p_{token}"
+            )
+            for height in available_heights
+        ]
+        # Two buttons per row
+        buttons = [quality_buttons[i:i + 2] for i in range(0, len(quality_buttons), 2)]
         
         if not buttons:
             logger.warning(f"No buttons created for available heights: {available_heights}")
@@ -408,76 +594,43 @@ class BotHandlers:
     
     async def _show_audio_quality_selection(self, event, url: str):
         """Show audio quality selection buttons."""
+        token = self._url_token(url)
         buttons = [
-            [
-                Button.inline("Высокое качество", data=f"audio_high_{url}"),
-                Button.inline("Среднее качество", data=f"audio_medium_{url}")
-            ],
-            [
-                Button.inline("Низкое качество", data=f"audio_low_{url}")
-            ]
+            [Button.inline(label, data=f"audio_{quality}_{token}") for label, quality in row]
+            for row in _AUDIO_QUALITY_ROWS
         ]
         await event.edit("Выберите качество аудио:", buttons=buttons)
     
     async def _handle_quality_callback(self, event, data: str):
         """Handle video quality selection."""
-        parts = data.split('_', 2)
-        if len(parts) != 3:
+        quality, sep, token = data.partition('_')
+        if not sep:
+            return
+        url = await self._resolve_url_token(event, token)
+        if url is None:
             return
-        
-        quality, url = parts[1], parts[2]
         await event.answer(f"Загрузка видео в качестве {quality}...")
         
-        await self._download_and_send_video(event, url, quality)
+        await self._download_and_send_content(event, url, _SOURCES['youtube_video'], quality)
     
     async def _handle_audio_callback(self, event, data: str):
         """Handle audio quality selection."""
-        parts = data.split('_', 2)
-        if len(parts) != 3:
+        quality, sep, token = data.partition('_')
+        if not sep:
+            return
+        url = await self._resolve_url_token(event, token)
+        if url is None:
             return
-        
-        quality, url = parts[1], parts[2]
         await event.answer(f"Загрузка аудио в качестве {quality}...")
         
-        await self._download_and_send_audio(event, url, quality)
-    
-    async def _download_and_send_video(self, event, url: str, quality: str):
-        """Download and send YouTube video."""
-        def track_video(user_id, quality, username, success, error_message=None):
-            self.stats.track_video_download(user_id, quality, 'youtube', username, success=success, error_message=error_message)
-        
-        await self._download_and_send_content(
-            event=event,
-            url=url,
-            quality=quality,
-            content_type="видео",
-            download_func=download_youtube_video,
-            send_func=send_video_content,
-            track_func=track_video,
-            action='video'
-        )
-    
-    async def _download_and_send_audio(self, event, url: str, quality: str):
-        """Download and send YouTube audio."""
-        await self._download_and_send_content(
-            event=event,
-            url=url,
-            quality=quality,
-            content_type="аудио",
-            download_func=download_youtube_audio,
-            send_func=send_audio_content,
-            track_func=self.stats.track_audio_download,
-            action='audio'
-        )
+        await self._download_and_send_content(event, url, _SOURCES['youtube_audio'], quality)
     
-    async def _handle_stats_callback(self, event, data: str):
-        """Handle statistics view callback."""
-        period = data.split('_')[1]  # Extract period (day, month, all)
-        
+    async def _handle_stats_callback(self, event, period: str):
+        """Handle statistics view callback for a period (day, month, all)."""
         await event.answer("Загрузка статистики...")
         
         try:
-            stats = self.stats.get_statistics(period)
+            stats = await asyncio.to_thread(self.stats.get_statistics, period)
             
             # Format period name in Russian
             period_names = {
@@ -488,89 +641,78 @@ class BotHandlers:
             period_name = period_names.get(period, period)
             
             # Build statistics message
-            message = f"📊 Статистика бота Komuzik {period_name}\n\n"
-            
-            message += f"👥 Пользователей: {stats['total_users']}\n"
-            message += f"🔍 Поисков: {stats['total_searches']}\n\n"
-            
-            message += f"📥 Всего загрузок: {stats['total_downloads']}\n"
-            message += f"  ✅ Успешных: {stats['successful_downloads']}\n"
-            message += f"  ❌ Ошибок: {stats['failed_downloads']}\n\n"
-            
-            message += f"🎬 Видео (YouTube): {stats['total_videos']}\n"
-            message += f"🎵 Аудио: {stats['total_audio']}\n"
-            message += f"📱 TikTok: {stats['total_tiktoks']}\n\n"
+            parts = [
+                f"📊 Статистика бота Komuzik {period_name}\n\n",
+                
+                f"👥 Пользователей: {stats['total_users']}\n",
+                f"🔍 Поисков: {stats['total_searches']}\n\n",
+                
+                f"📥 Всего загрузок: {stats['total_downloads']}\n",
+                f"  ✅ Успешных: {stats['successful_downloads']}\n",
+                f"  ❌ Ошибок: {stats['failed_downloads']}\n\n",
+                
+                f"🎬 Видео (YouTube): {stats['total_videos']}\n",
+                f"🎵 Аудио: {stats['total_audio']}\n",
+                f"📱 TikTok: {stats['total_tiktoks']}\n\n",
+            ]
             
             # Popular video formats
             if stats['popular_video_formats']:
-                message += "📊 Популярные форматы видео:\n"
-                for format_name, count in stats['popular_video_formats']:
-                    message += f"  • {format_name}: {count}\n"
-                message += "\n"
+                parts.append("📊 Популярные форматы видео:\n")
+                parts.extend(f"  • {format_name}: {count}\n" for format_name, count in stats['popular_video_formats'])
+                parts.append("\n")
             
             # Popular audio formats
             if stats['popular_audio_formats']:
-                message += "🎧 Популярные форматы аудио:\n"
-                for format_name, count in stats['popular_audio_formats']:
-                    message += f"  • {format_name}: {count}\n"
+                parts.append("🎧 Популярные форматы аудио:\n")
+                parts.extend(f"  • {format_name}: {count}\n" for format_name, count in stats['popular_audio_formats'])
             
-            # Add buttons to switch periods
-            buttons = [
-                [
-                    Button.inline("📊 За день", data="stats_day"),
-                    Button.inline("📅 За месяц", data="stats_month")
-                ],
-                [
-                    Button.inline("📈 За все время", data="stats_all")
-                ]
-            ]
-            
-            await event.edit(message, buttons=buttons)
+            await event.edit("".join(parts), buttons=_STATS_PERIOD_BUTTONS)
             
         except Exception as e:
             logger.error(f"Error getting statistics: {e}")
             await event.edit(f"Произошла ошибка при получении статистики: {str(e)}")
     
-    async def _handle_twitter(self, event: Message, url: str):
-        """Handle Twitter/X video and photo download."""
-        user_id, username = self._get_user_info(event)
-        download_id = str(uuid.uuid4())
+    async def _broadcast(self, message, user_ids: list) -> int:
+        """Send a message to many users concurrently at a bounded rate.
         
-        if not await self._check_download_limit(event, user_id, download_id):
-            return
+        At most BROADCAST_CONCURRENCY sends are in flight, and sends start
+        no more often than BROADCAST_RATE per second.
         
-        try:
-            async with event.client.action(event.chat_id, 'video'):
+        Args:
+            message: Message to send
+            user_ids: Recipient user IDs
+            
+        Returns:
+            Number of users the message was sent to
+        """
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        loop = asyncio.get_running_loop()
+        interval = 1 / BROADCAST_RATE
+        next_start = loop.time()
+        
+        async def send_one(user_id: int) -> bool:
+            nonlocal next_start
+            async with semaphore:
+                # Reserve the next start time slot, then wait for it
+                now = loop.time()
+                start = max(now, next_start)
+                next_start = start + interval
+                if start > now:
+                    await asyncio.sleep(start - now)
                 try:
-                    processing_msg = await event.respond("Загрузка с Twitter... Пожалуйста, подождите.")
-                    logger.info(f"Downloading Twitter content: {url}")
-                    
-                    file_path, metadata = await download_twitter_video(url)
-                    logger.info(f"Twitter content downloaded successfully: {file_path}")
-                    
-                    # Send appropriate content type
-                    if metadata.get('content_type') == 'photo':
-                        await send_image_content(event, file_path, self.bot_username)
-                    else:
-                        await send_video_content(event, file_path, metadata, self.bot_username)
-                    
-                    await processing_msg.delete()
-                    
-                    self.stats.track_tiktok_download(user_id, username, success=True)
-                    
-                    if os.path.exists(os.path.dirname(file_path)):
-                        shutil.rmtree(os.path.dirname(file_path))
-                        
+                    await self._send_with_flood_wait(self.client.send_message, user_id, message)
+                    return True
                 except Exception as e:
-                    logger.error(f"Error sending Twitter content: {e}")
-                    self.stats.track_tiktok_download(user_id, username, success=False, error_message=str(e))
-                    await event.respond(f"Произошла ошибка при обработке контента: {str(e)}")
-        finally:
-            self.download_limiter.finish_download(user_id, download_id)
+                    logger.warning(f"Failed to send message to user {user_id}: {e}")
+                    return False
+        
+        results = await asyncio.gather(*(send_one(user_id) for user_id in user_ids))
+        return sum(results)
     
     async def post_handler(self, event: Message):
         """Handle /post command for admin broadcast."""
-        user_id, username = self._get_user_info(event)
+        user_id = event.sender_id
         
         if user_id not in self.download_limiter.ADMIN_USER_IDS:
             await event.respond("❌ У вас нет доступа к этой команде.")
@@ -586,18 +728,13 @@ class BotHandlers:
             
             processing_msg = await event.respond("📢 Отправляю сообщение всем пользователям...")
             
-            # Get all users from database
-            users = self.stats.get_all_users()
-            sent_count = 0
-            failed_count = 0
-            
-            for user_id_target, _ in users:
-                try:
-                    await self.client.send_message(user_id_target, reply_msg)
-                    sent_count += 1
-                except Exception as e:
-                    logger.warning(f"Failed to send message to user {user_id_target}: {e}")
-                    failed_count += 1
+            # Fetch users page by page and start sending after the first page
+            users = self.stats.iter_all_users()
+            total_count = sent_count = 0
+            while (batch := await asyncio.to_thread(next, users, None)) is not None:
+                total_count += len(batch)
+                sent_count += await self._broadcast(reply_msg, [user_id_target for user_id_target, _ in batch])
+            failed_count = total_count - sent_count
             
             result = f"✅ Сообщение отправлено {sent_count} пользователям"
             if failed_count > 0:
@@ -609,17 +746,32 @@ class BotHandlers:
             logger.error(f"Error in post handler: {e}")
             await event.respond(f"Произошла ошибка: {str(e)}")
     
+    async def clearcache_handler(self, event: Message):
+        """Handle /clearcache command: drop cached video info and search results (admins only)."""
+        if event.sender_id not in self.download_limiter.ADMIN_USER_IDS:
+            await event.respond("❌ У вас нет доступа к этой команде.")
+            return
+        
+        clear_cache()
+        await event.respond("🧹 Кэш очищен.")
+    
     async def report_handler(self, event: Message):
         """Handle /report command for user reports."""
-        user_id, username = self._get_user_info(event)
+        user_id = event.sender_id
         
-        REPORT_STATES[user_id] = True
+        REPORT_STATES.add(user_id)
         
         await event.respond(
             "📝 Опишите проблему (или отправьте /cancel для отмены):",
             buttons=[[Button.inline("❌ Отмена", data="report_cancel")]]
         )
     
+    async def cancel_handler(self, event: Message):
+        """Handle /cancel command: leave the /report state."""
+        if event.sender_id in REPORT_STATES:
+            REPORT_STATES.discard(event.sender_id)
+            await event.respond("❌ Отправка отчета отменена.")
+    
     async def callback_handler(self, event):
         """Handle callback queries from inline buttons."""
         data = event.data.decode('utf-8')
@@ -627,24 +779,16 @@ class BotHandlers:
         
         # Handle report cancel
         if data == "report_cancel":
-            if user_id in REPORT_STATES:
-                del REPORT_STATES[user_id]
+            REPORT_STATES.discard(user_id)
             await event.edit("❌ Отправка отчета отменена.")
             return
         
-        # Route callbacks using dictionary
-        handlers: Dict[str, Callable] = {
-            'select_': self._handle_select_callback,
-            'content_': self._handle_content_callback,
-            'quality_': self._handle_quality_callback,
-            'audio_': self._handle_audio_callback,
-            'stats_': self._handle_stats_callback,
-        }
-        
-        for prefix, handler in handlers.items():
-            if data.startswith(prefix):
-                await handler(event, data)
-                return
+        # Route by prefix; handlers get the data after it
+        prefix, _, rest = data.partition('_')
+        handler = self._routes.get(prefix)
+        if handler is not None:
+            await handler(event, rest)
+            return
         
         logger.warning(f"Unknown callback data: {data}")
 
@@ -55,12 +55,24 @@ async def main():
     logger.info(f"Bot started as @{bot_username}!")
     
     # Register all handlers
-    BotHandlers(client, stats_repo, bot_username)
+    handlers = BotHandlers(client, stats_repo, bot_username)
+    
+    # Release download slots that were never finished
+    cleanup_task = handlers.download_limiter.start_cleanup()
+    
+    # Write usage statistics in batches
+    stats_task = handlers.start_stats_writer()
     
     # Run until disconnected
     try:
         await client.run_until_disconnected()
     finally:
+        cleanup_task.cancel()
+        stats_task.cancel()
+        # Let the writer finish the batch it holds before flushing the rest
+        await asyncio.gather(stats_task, return_exceptions=True)
+        handlers.flush_stats()
+        handlers.shutdown_stats_writer()
         db.close()
         await client.disconnect()
 
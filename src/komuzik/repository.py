@@ -1,6 +1,6 @@
 """Repository layer for statistics tracking and data access."""
 import logging
-from typing import Dict, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from .database import Database
 
 logger = logging.getLogger(__name__)
@@ -30,7 +30,8 @@ class StatsRepository:
             # Check if user exists
             existing = self.db.fetchone(
                 "SELECT user_id FROM users WHERE user_id = ?",
-                (user_id,)
+                (user_id,),
+                row_factory=None
             )
             
             if existing:
@@ -195,6 +196,43 @@ class StatsRepository:
         except Exception as e:
             logger.error(f"Failed to track event {event_type}: {e}")
     
+    def track_batch(self, events: Iterable[tuple]):
+        """Write a batch of queued tracking events in one transaction.
+        
+        Args:
+            events: ('user', user_id, username) tuples for user activity and
+                (event_type, user_id, username, video_format, platform, success,
+                error_message) tuples for statistics events, in arrival order
+        """
+        # Repeated activity of one user collapses into a single upsert with the latest username
+        users: Dict[int, Optional[str]] = {}
+        rows = []
+        for event in events:
+            if event[0] == 'user':
+                users[event[1]] = event[2]
+            else:
+                rows.append(event)
+        
+        try:
+            with self.db.transaction():
+                if users:
+                    self.db.execute_many(
+                        '''INSERT INTO users (user_id, username) VALUES (?, ?)
+                           ON CONFLICT(user_id) DO UPDATE SET
+                               last_seen = CURRENT_TIMESTAMP, username = excluded.username''',
+                        users.items()
+                    )
+                if rows:
+                    self.db.execute_many(
+                        '''INSERT INTO statistics 
+                           (event_type, user_id, username, video_format, platform, success, error_message)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                        rows
+                    )
+            logger.debug(f"Tracked batch: {len(users)} users, {len(rows)} events")
+        except Exception as e:
+            logger.error(f"Failed to track batch of {len(users) + len(rows)} events: {e}")
+    
     # === Statistics queries ===
     
     def get_statistics(self, period: str = 'all') -> Dict:
@@ -257,7 +295,7 @@ class StatsRepository:
             # Count all registered users
             query = "SELECT COUNT(*) FROM users"
         
-        result = self.db.fetchone(query)
+        result = self.db.fetchone(query, row_factory=None)
         return result[0] if result else 0
     
     def _get_event_count(self, event_type: str, date_filter: str) -> int:
@@ -271,7 +309,7 @@ class StatsRepository:
             Number of events
         """
         query = f"SELECT COUNT(*) FROM statistics WHERE event_type = ? {date_filter}"
-        result = self.db.fetchone(query, (event_type,))
+        result = self.db.fetchone(query, (event_type,), row_factory=None)
         return result[0] if result else 0
     
     def _get_total_downloads(self, date_filter: str) -> int:
@@ -286,7 +324,7 @@ class StatsRepository:
         query = f'''SELECT COUNT(*) FROM statistics 
                     WHERE event_type IN ('video_download', 'audio_download', 'tiktok_download')
                     {date_filter}'''
-        result = self.db.fetchone(query)
+        result = self.db.fetchone(query, row_factory=None)
         return result[0] if result else 0
     
     def _get_successful_downloads(self, date_filter: str) -> int:
@@ -302,7 +340,7 @@ class StatsRepository:
                     WHERE event_type IN ('video_download', 'audio_download', 'tiktok_download')
                     AND success = 1
                     {date_filter}'''
-        result = self.db.fetchone(query)
+        result = self.db.fetchone(query, row_factory=None)
         return result[0] if result else 0
     
     def _get_failed_downloads(self, date_filter: str) -> int:
@@ -318,7 +356,7 @@ class StatsRepository:
                     WHERE event_type IN ('video_download', 'audio_download', 'tiktok_download')
                     AND success = 0
                     {date_filter}'''
-        result = self.db.fetchone(query)
+        result = self.db.fetchone(query, row_factory=None)
         return result[0] if result else 0
     
     def _get_popular_formats(self, event_type: str, date_filter: str, limit: int = 5) -> list:
@@ -339,7 +377,7 @@ class StatsRepository:
                     GROUP BY video_format
                     ORDER BY count DESC
                     LIMIT ?'''
-        results = self.db.fetchall(query, (event_type, limit))
+        results = self.db.fetchall(query, (event_type, limit), row_factory=None)
         return [(row[0], row[1]) for row in results] if results else []
     
     def _get_error_count(self, date_filter: str) -> int:
@@ -354,7 +392,7 @@ class StatsRepository:
         query = f'''SELECT COUNT(*) FROM statistics 
                     WHERE event_type LIKE 'error_%'
                     {date_filter}'''
-        result = self.db.fetchone(query)
+        result = self.db.fetchone(query, row_factory=None)
         return result[0] if result else 0
     
     def get_all_users(self) -> list:
@@ -364,12 +402,50 @@ class StatsRepository:
             List of tuples (user_id, username)
         """
         try:
-            results = self.db.fetchall("SELECT user_id, username FROM users")
+            results = self.db.fetchall("SELECT user_id, username FROM users", row_factory=None)
             return [(row[0], row[1]) for row in results] if results else []
         except Exception as e:
             logger.error(f"Failed to get all users: {e}")
             return []
     
+    def iter_all_users(self, batch_size: int = 500) -> Iterator[List[Tuple[int, Optional[str]]]]:
+        """Iterate over all tracked users in batches.
+        
+        Each batch is a separate keyset-paginated query, so no connection or
+        read snapshot is held between batches.
+        
+        Args:
+            batch_size: Maximum number of users per batch
+            
+        Yields:
+            Lists of tuples (user_id, username)
+        """
+        last_user_id = None
+        while True:
+            try:
+                if last_user_id is None:
+                    batch = self.db.fetchall(
+                        "SELECT user_id, username FROM users ORDER BY user_id LIMIT ?",
+                        (batch_size,),
+                        row_factory=None
+                    )
+                else:
+                    batch = self.db.fetchall(
+                        "SELECT user_id, username FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                        (last_user_id, batch_size),
+                        row_factory=None
+                    )
+            except Exception as e:
+                logger.error(f"Failed to get users: {e}")
+                return
+            
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last_user_id = batch[-1][0]
+    
     # === Report tracking ===
     
     def save_user_report(self, user_id: int, username: Optional[str], report_text: str):